@@ -0,0 +1,73 @@
+""" Compares `rest.Cache` against the list-ordered cache it replaced, putting
+    and getting 1M objects at a few cache sizes. The old cache's eviction
+    shifts the whole order list, so it gets slower as the cache grows; the
+    old numbers stop at 100k entries since at 1M it takes too long to wait
+    for.
+
+    Run with `python benchmarks/cache.py` after installing the package. """
+
+import random
+import time
+
+from dubious.discord import api
+from dubious.discord.rest import Cache
+
+N = 1_000_000
+
+class ListCache:
+    """ The old cache's eviction, for comparison. """
+
+    def __init__(self, maxSize: int):
+        self.maxSize = maxSize
+        self.items: dict[api.Snowflake, api.IDable] = {}
+        self.order: list[api.Snowflake] = []
+
+    def put(self, item: api.IDable):
+        if item.id in self.items:
+            return self.items[item.id]
+        if len(self.items) + 1 > self.maxSize:
+            self.items.pop(self.order[0])
+            self.order.pop(0)
+        self.items[item.id] = item
+        self.order.append(item.id)
+        return item
+
+    def get(self, oID: api.Snowflake):
+        return self.items.get(oID)
+
+def run(cache: Cache | ListCache, items: list[api.IDable], lookups: list[api.Snowflake]):
+    start = time.perf_counter()
+    for item in items:
+        cache.put(item)
+    putTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for oID in lookups:
+        cache.get(oID)
+    getTime = time.perf_counter() - start
+    return putTime, getTime
+
+def main():
+    items = [api.IDable.construct(id=api.Snowflake(n)) for n in range(N)]
+    # Mostly recent objects, as lookups tend to be
+    lookups = [api.Snowflake(int(N - 1 - random.expovariate(1 / 50_000)) % N) for _ in range(N)]
+
+    print(f"{N:,} puts and {N:,} gets")
+    for maxSize in (10_000, 100_000, 1_000_000):
+        cache = Cache(api.IDable, maxSize)
+        putTime, getTime = run(cache, items, lookups)
+        stats = cache.stats()
+        print(
+            f"  Cache     maxSize {maxSize:>9,}: put {N / putTime / 1e6:5.2f}M/s, get {N / getTime / 1e6:5.2f}M/s, "
+            f"{stats['hits'] / N:.0%} hits, {stats['evictions']:,} evictions"
+        )
+        if maxSize <= 100_000:
+            putTime, getTime = run(ListCache(maxSize), items, lookups)
+            print(f"  ListCache maxSize {maxSize:>9,}: put {N / putTime / 1e6:5.2f}M/s, get {N / getTime / 1e6:5.2f}M/s")
+
+    cache = Cache(api.IDable, N, maxBytes=64 * 2**20)
+    putTime, _ = run(cache, items, [])
+    print(f"  Cache with a 64MiB budget: put {N / putTime / 1e6:5.2f}M/s, kept {len(cache):,} ({cache.size / 2**20:.0f}MiB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+""" Compares how long a `Chip` takes to get through a replayed recording when
+    some handlers are slow (standing in for REST calls), with the default
+    one-at-a-time `Dispatcher` against a `ConcurrentDispatcher` and a
+    `PartitionedDispatcher`. Also counts messages that were handled before an
+    earlier message from the same guild.
+
+    Run with `python benchmarks/dispatch.py` after installing the package. """
+
+import asyncio
+import os
+import tempfile
+import time
+
+from dubious.discord import codec, enums
+from dubious.discord.recording import Recorder
+from dubious.discord.replay import Replayer
+from dubious.Dispatch import ConcurrentDispatcher, Dispatcher, PartitionedDispatcher
+from dubious.Pory import Chip
+
+import payloads
+
+# Seconds a slow handler takes, and how often a message hits one
+SLOW = 0.05
+EVERY = 20
+
+def record(path: str):
+    recorder = Recorder(path)
+    for payload in payloads.stream(guilds=10, members=10, messages=2000):
+        recorder.write(codec.dumps(payload))
+    recorder.close()
+
+def run(path: str, dispatcher: Dispatcher):
+    messages = 0
+    outOfOrder = 0
+    lastSeq: dict[str, int] = {}
+    async def handler(code: enums.codes, payload):
+        nonlocal messages, outOfOrder
+        if code != enums.tcode.MessageCreate: return
+        messages += 1
+        if messages % EVERY == 0:
+            await asyncio.sleep(SLOW)
+        guildID = payload.d["guild_id"]
+        if payload.s < lastSeq.get(guildID, 0):
+            outOfOrder += 1
+        lastSeq[guildID] = payload.s
+
+    chip = Chip(dispatcher)
+    chip.addHandler(handler)
+    Replayer.doDebug = False
+    # Includes waiting for the last handlers to finish on stop.
+    start = time.perf_counter()
+    chip.replay(path, speed=None)
+    return time.perf_counter() - start, dispatcher.peakInFlight, outOfOrder
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "dispatch.dubrec")
+    record(path)
+    for name, dispatcher in (
+        ("sequential", Dispatcher()),
+        ("concurrent, limit 8", ConcurrentDispatcher(8)),
+        ("concurrent, limit 64", ConcurrentDispatcher(64)),
+        ("partitioned, 8", PartitionedDispatcher(8)),
+        ("partitioned, 16", PartitionedDispatcher(16)),
+    ):
+        elapsed, peak, outOfOrder = run(path, dispatcher)
+        print(f"{name:21} {elapsed:6.2f}s, peak {peak:2} events in flight, {outOfOrder} out of order")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+""" Measures events per second and delivery latency through the whole
+    `Discore` -> `Chip` -> `Pory` stack, against a local `FakeGateway`.
+
+    The gateway runs in a thread of this process, so both ends share the GIL -
+    the numbers are for comparing changes, not a ceiling.
+
+    Run with `python benchmarks/end_to_end.py [messages per second] [seconds]`
+    after installing the package. """
+
+import asyncio
+import datetime as dt
+import statistics
+import sys
+
+from dubious.discord import api, enums
+from dubious.discord.fake import FakeGateway
+from dubious.Machines import Handle
+from dubious.Pory import Chip, Pory
+
+class Timer(Pory):
+    latencies: list[float] = []
+
+    @Handle(enums.tcode.MessageCreate)
+    async def onMessage(self, message: api.Message):
+        Timer.latencies.append((dt.datetime.now(dt.timezone.utc) - message.timestamp).total_seconds())
+
+def main():
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    gateway = FakeGateway(guilds=100, members=50, messageRate=rate).serveInThread()
+
+    chip = Chip()
+    Timer().use(chip)
+    asyncio.get_event_loop().call_later(seconds, chip.stop)
+    chip.start("token", "auto", uri=gateway.uri)
+
+    latencies = sorted(Timer.latencies)
+    if not latencies:
+        return print("no messages were handled")
+    print(f"{gateway.dispatched} events sent, {len(latencies)} messages handled in {seconds:.0f}s")
+    print(f"{len(latencies) / seconds:,.0f} messages/s (asked for {rate:,.0f}/s)")
+    print(
+        f"latency p50 {statistics.median(latencies) * 1e3:.2f} ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:.2f} ms, "
+        f"max {latencies[-1] * 1e3:.2f} ms"
+    )
+
+if __name__ == "__main__":
+    main()
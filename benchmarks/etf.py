@@ -0,0 +1,63 @@
+""" Compares JSON and ETF wire size and parse throughput for gateway
+    payloads.
+
+    Each decoder is timed from the raw frame to a validated `api.Payload`,
+    which is the work `Discore` does for every message. ETF is timed with
+    both the pure-Python decoder and erlpack's, if it's installed.
+
+    Run with `python benchmarks/etf.py` after installing the package. """
+
+import json
+import time
+import zlib
+
+from dubious.discord import api, etf
+
+import payloads
+
+def snowflakesToInts(obj):
+    """ Discord sends snowflakes as bignums over ETF, not as strings. """
+
+    if isinstance(obj, dict):
+        return {k: (int(v) if isinstance(v, str) and v.isdigit() and (k == "id" or k.endswith("_id")) else snowflakesToInts(v))
+            for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [snowflakesToInts(v) for v in obj]
+    return obj
+
+def timeit(frames, parse, rounds: int):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for frame in frames:
+            parse(frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(rounds: int=5):
+    events = payloads.stream()
+    jsonFrames = [json.dumps(p).encode() for p in events]
+    etfFrames = [etf.dumps(snowflakesToInts(p)) for p in events]
+
+    assert etf.loads(etfFrames[0])["d"]["name"] == events[0]["d"]["name"]
+
+    print(f"{len(events)} events")
+    for name, frames in (("json", jsonFrames), ("etf", etfFrames)):
+        # As sent over a zlib-stream connection
+        compressor = zlib.compressobj()
+        compressed = sum(len(compressor.compress(f) + compressor.flush(zlib.Z_SYNC_FLUSH)) for f in frames)
+        print(f"{name + ':':9} {sum(map(len, frames)) / 1024:10.1f} KiB, {compressed / 1024:10.1f} KiB with zlib-stream")
+
+    decoders = [
+        ("json", jsonFrames, json.loads),
+        ("etf (py)", etfFrames, etf.pyLoads),
+    ]
+    if etf.accelerated:
+        decoders.append(("erlpack", etfFrames, etf.loads))
+    for name, frames, decode in decoders:
+        decoded = timeit(frames, decode, rounds)
+        parsed = timeit(frames, lambda f: api.Payload.lazy(decode(f)), rounds)
+        print(f"{name + ':':9} decode {len(frames) / decoded:10.0f} events/s, to Payload {len(frames) / parsed:10.0f} events/s")
+
+if __name__ == "__main__":
+    main()
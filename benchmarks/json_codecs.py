@@ -0,0 +1,40 @@
+""" Times every installed JSON library on representative Discord payloads, so
+    the fastest one can be set with `DUBIOUS_JSON` or `codec.use`.
+
+    Run with `python benchmarks/json_codecs.py` after installing the package. """
+
+import time
+
+from dubious.discord import api, codec, make
+
+import payloads
+
+def timeit(items, fn, rounds: int):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(rounds: int=5):
+    events = payloads.stream()
+    frames = [codec.get("json")[1](p) for p in events]
+    # What goes out: gateway commands and REST bodies built from `make` models.
+    outgoing = [
+        api.Payload(op=api.opcode.Heartbeat, t=None, s=n, d=None).dict() for n in range(500)
+    ] + [
+        make.RMessage(content=f"message {n}", embeds=[make.Embed(title="title", description="x" * 200)]).dict() for n in range(500)
+    ]
+
+    print(f"{len(frames)} inbound frames, {len(outgoing)} outbound bodies")
+    for name in codec.available():
+        loads, dumps = codec.get(name)
+        decode = timeit(frames, loads, rounds)
+        encode = timeit(outgoing, dumps, rounds)
+        print(f"{name:7} loads {len(frames) / decode:10.0f}/s   dumps {len(outgoing) / encode:10.0f}/s")
+    print(f"default: {codec.name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+""" Measures the per-event cost of the receive loop pattern: wrapping every
+    `queue.get()` in a one-second `wait_for` (as the loops used to) against
+    awaiting the queue directly.
+
+    Also measures how long `Core.stop` takes to bring the loops down.
+
+    Run with `python benchmarks/loop_overhead.py` after installing the package. """
+
+import asyncio
+import time
+
+from dubious.discord.core import Core
+
+class Loops(Core):
+    doDebug = False
+
+    def __init__(self, direct: bool, events: int):
+        self.direct = direct
+        self.events = events
+        self.running = asyncio.Event()
+        self.q: asyncio.Queue[int] = asyncio.Queue()
+        self.handled = 0
+
+    def getcoros(self):
+        return (self._produce(), self._consume())
+
+    def set(self): self.running.set()
+    def isRunning(self): return self.running.is_set()
+    def clear(self): self.running.clear()
+    async def close(self): pass
+
+    async def _produce(self):
+        for n in range(self.events):
+            self.q.put_nowait(n)
+            if n % 100 == 0: await asyncio.sleep(0)
+
+    async def _consume(self):
+        while self.running.is_set():
+            if self.direct:
+                await self.q.get()
+            else:
+                try:
+                    await asyncio.wait_for(self.q.get(), 1)
+                except asyncio.TimeoutError:
+                    continue
+            self.handled += 1
+            if self.handled == self.events:
+                self.start_stop = time.perf_counter()
+                self.stop()
+
+def run(direct: bool, events: int):
+    loops = Loops(direct, events)
+    start = time.perf_counter()
+    loops.start()
+    end = time.perf_counter()
+    return (loops.start_stop - start) / events, end - loops.start_stop
+
+def main(events: int=200_000):
+    for name, direct in (("wait_for per event", False), ("direct await", True)):
+        perEvent, shutdown = run(direct, events)
+        print(f"{name:19} {perEvent * 1e6:6.2f} us/event, stopped in {shutdown * 1e3:6.2f} ms")
+
+if __name__ == "__main__":
+    main()
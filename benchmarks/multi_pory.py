@@ -0,0 +1,63 @@
+""" Measures the cost of several `Pory`s on one `Chip` handling the same
+    events, with the cast of each payload shared between them (as now)
+    against every `Pory` parsing it again (as before).
+
+    Run with `python benchmarks/multi_pory.py` after installing the package. """
+
+import os
+import tempfile
+import time
+
+from dubious.discord import api, codec, enums
+from dubious.discord.recording import Recorder
+from dubious.discord.replay import Replayer
+from dubious.Machines import Handle
+from dubious.Pory import Chip, Pory
+
+import payloads
+
+PORYS = 5
+
+class Listener(Pory):
+    @Handle(enums.tcode.GuildCreate)
+    async def onGuild(self, guild: api.Guild):
+        pass
+
+    @Handle(enums.tcode.MessageCreate)
+    async def onMessage(self, message: api.Message):
+        pass
+
+async def forget(code: enums.codes, payload: api.Payload):
+    """ Drops the cast kept on the payload, so the next `Pory` parses it again. """
+
+    payload._cast = False
+
+def record(path: str):
+    recorder = Recorder(path)
+    for payload in payloads.stream(guilds=50, members=100, messages=5000):
+        recorder.write(codec.dumps(payload))
+    recorder.close()
+
+def run(path: str, shared: bool):
+    chip = Chip()
+    for _ in range(PORYS):
+        Listener().use(chip)
+        if not shared: chip.addHandler(forget)
+    start = time.perf_counter()
+    chip.replay(path, speed=None)
+    return time.perf_counter() - start
+
+def main():
+    Replayer.doDebug = False
+    path = os.path.join(tempfile.mkdtemp(), "porys.dubrec")
+    record(path)
+    # Parse once first so neither run pays for warming up pydantic.
+    run(path, True)
+
+    each = run(path, False)
+    shared = run(path, True)
+    print(f"{PORYS} Porys, each parsing: {each:6.2f}s")
+    print(f"{PORYS} Porys, sharing:      {shared:6.2f}s ({each / shared:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+""" Synthetic gateway traffic shaped like what Discord sends, for use by the
+    other benchmarks in this folder. """
+
+import random
+
+BASE = 81384788765712384
+
+def snowflake(n: int):
+    return str(BASE + n)
+
+def user(n: int):
+    return {
+        "id": snowflake(n),
+        "username": f"user{n}",
+        "discriminator": f"{n % 10000:04}",
+        "avatar": "a_" + "f" * 30,
+        "public_flags": 0,
+    }
+
+def member(n: int, gid: int):
+    return {
+        "user": user(n),
+        "roles": [snowflake(gid + r) for r in range(n % 4)],
+        "joined_at": "2021-05-01T12:34:56.789000+00:00",
+        "nick": None,
+        "deaf": False,
+        "mute": False,
+        "pending": False,
+        "premium_since": None,
+        "avatar": None,
+    }
+
+def role(n: int):
+    return {
+        "id": snowflake(n),
+        "name": f"role{n}",
+        "color": 0x3498DB,
+        "hoist": False,
+        "position": n % 20,
+        "permissions": "1071698660929",
+        "managed": False,
+        "mentionable": True,
+    }
+
+def channel(n: int, gid: int):
+    return {
+        "id": snowflake(n),
+        "type": 0,
+        "guild_id": snowflake(gid),
+        "position": n % 50,
+        "permission_overwrites": [],
+        "name": f"channel-{n}",
+        "topic": None,
+        "nsfw": False,
+        "last_message_id": snowflake(n + 1),
+        "rate_limit_per_user": 0,
+        "parent_id": None,
+    }
+
+def guild(gid: int, members: int=100, channels: int=20, roles: int=10):
+    return {
+        "id": snowflake(gid),
+        "name": f"guild {gid}",
+        "icon": None,
+        "splash": None,
+        "discovery_splash": None,
+        "owner_id": snowflake(gid + 1),
+        "afk_channel_id": None,
+        "afk_timeout": 300,
+        "verification_level": 1,
+        "default_message_notifications": 1,
+        "explicit_content_filter": 2,
+        "roles": [role(gid + i) for i in range(roles)],
+        "emojis": [],
+        "features": ["COMMUNITY", "NEWS"],
+        "mfa_level": 0,
+        "application_id": None,
+        "system_channel_id": snowflake(gid + 2),
+        "system_channel_flags": 0,
+        "rules_channel_id": None,
+        "vanity_url_code": None,
+        "description": None,
+        "banner": None,
+        "premium_tier": 1,
+        "preferred_locale": "en-US",
+        "public_updates_channel_id": None,
+        "nsfw_level": 0,
+        "joined_at": "2021-05-01T12:34:56.789000+00:00",
+        "large": members > 250,
+        "unavailable": False,
+        "member_count": members,
+        "voice_states": [],
+        "members": [member(gid + 1000 + i, gid) for i in range(members)],
+        "channels": [channel(gid + 100 + i, gid) for i in range(channels)],
+        "presences": [],
+        "stage_instances": [],
+        "threads": [],
+    }
+
+def message(n: int, gid: int=0):
+    return {
+        "id": snowflake(n),
+        "channel_id": snowflake(gid + 100),
+        "guild_id": snowflake(gid),
+        "author": user(n % 500),
+        "member": {
+            "roles": [],
+            "joined_at": "2021-05-01T12:34:56.789000+00:00",
+            "deaf": False,
+            "mute": False,
+        },
+        "content": " ".join(random.choice(["hello", "world", "pory", "lapras", "<@123>"]) for _ in range(12)),
+        "timestamp": "2022-07-01T12:34:56.789000+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+        "flags": 0,
+    }
+
+def typing(n: int, gid: int=0):
+    return {
+        "user_id": snowflake(n % 500),
+        "channel_id": snowflake(gid + 100),
+        "guild_id": snowflake(gid),
+        "timestamp": 1656678896,
+    }
+
+def dispatch(t: str, d: dict, s: int):
+    return {"op": 0, "t": t, "s": s, "d": d}
+
+def stream(guilds: int=20, members: int=100, messages: int=500):
+    """ A list of dispatch payloads: a GUILD_CREATE for each guild followed by
+        interleaved MESSAGE_CREATE and TYPING_START events. """
+
+    s = 0
+    payloads = []
+    for g in range(guilds):
+        s += 1
+        payloads.append(dispatch("GUILD_CREATE", guild(g * 100000, members), s))
+    for m in range(messages):
+        gid = (m % guilds) * 100000
+        s += 1
+        payloads.append(dispatch("MESSAGE_CREATE", message(10**7 + m, gid), s))
+        s += 1
+        payloads.append(dispatch("TYPING_START", typing(m, gid), s))
+    return payloads
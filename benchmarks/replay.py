@@ -0,0 +1,51 @@
+""" Records a synthetic stream of gateway traffic with a `Recorder`, then
+    measures how fast a `Chip` with one `Pory` gets through it when replayed
+    as fast as possible.
+
+    Pass a path to replay a real recording (made with `Chip.start(...,
+    recordPath=...)`) instead.
+
+    Run with `python benchmarks/replay.py [recording]` after installing the
+    package. """
+
+import os
+import sys
+import tempfile
+
+from dubious.discord import api, codec, enums
+from dubious.discord.recording import Recorder
+from dubious.Machines import Handle
+from dubious.Pory import Chip, Pory
+
+import payloads
+
+class Counter(Pory):
+    messages = 0
+
+    @Handle(enums.tcode.MessageCreate)
+    async def onMessage(self, message: api.Message):
+        Counter.messages += 1
+
+def record(path: str):
+    recorder = Recorder(path)
+    for payload in payloads.stream(guilds=50, messages=20_000):
+        recorder.write(codec.dumps(payload))
+    recorder.close()
+    return recorder.frames
+
+def main():
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "synthetic.dubrec")
+        print(f"recorded {record(path)} frames to {path}")
+
+    chip = Chip()
+    chip.doDebug = False
+    Counter().use(chip)
+    # Prints the payloads per second when it's done.
+    chip.replay(path, speed=None)
+    print(f"{Counter.messages} messages handled by the Pory")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+""" Compares plain JSON gateway frames with zlib-stream compressed frames.
+
+    Reports the bytes that would cross the wire for each, and the CPU time
+    `Discore` spends per event turning a frame into a `Payload`.
+
+    Run with `python benchmarks/zlib_stream.py` after installing the package. """
+
+import json
+import time
+import zlib
+
+from dubious.discord.core import Discore
+
+import payloads
+
+def main(rounds: int=5):
+    events = payloads.stream()
+    texts = [json.dumps(p) for p in events]
+
+    # Discord keeps one deflate context per connection and sync-flushes after
+    #  every message.
+    deflator = zlib.compressobj()
+    frames = [deflator.compress(t.encode()) + deflator.flush(zlib.Z_SYNC_FLUSH) for t in texts]
+
+    plainBytes = sum(len(t.encode()) for t in texts)
+    zlibBytes = sum(len(f) for f in frames)
+    print(f"{len(events)} events")
+    print(f"json:        {plainBytes / 1024:10.1f} KiB")
+    print(f"zlib-stream: {zlibBytes / 1024:10.1f} KiB ({100 - zlibBytes * 100 / plainBytes:.1f}% saved)")
+
+    core = Discore("token", 0)
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.process_time()
+        for text in texts:
+            core._decode(text)
+        best = min(best, time.process_time() - start)
+    print(f"json:        {best * 1e6 / len(events):8.1f} us/event")
+
+    core = Discore("token", 0, compress=True)
+    best = float("inf")
+    for _ in range(rounds):
+        core._inflator = zlib.decompressobj()
+        core._buffer = bytearray()
+        start = time.process_time()
+        for frame in frames:
+            core._decode(core._inflate(frame))
+        best = min(best, time.process_time() - start)
+    print(f"zlib-stream: {best * 1e6 / len(events):8.1f} us/event")
+
+if __name__ == "__main__":
+    main()
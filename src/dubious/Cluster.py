@@ -0,0 +1,266 @@
+import asyncio
+import multiprocessing as mp
+import os
+import queue
+import signal
+import tempfile
+import time
+from typing import Any, Callable, ClassVar, Literal
+
+from dubious.discord.shards import ShardManager
+from dubious.Dispatch import Dispatcher
+from dubious.Pory import Chip, Pory
+
+t_PoryFactory = Callable[[], Pory]
+t_DispatcherFactory = Callable[[], Dispatcher]
+
+class Worker:
+    """ The supervisor's view of one worker process. """
+
+    id: int
+    shardIDs: list[int]
+    process: Any
+    restarts: int
+    # The latest report sent by the worker, and when it was recieved
+    report: dict[str, Any]
+    reportedAt: float | None
+
+    def __init__(self, workerID: int, shardIDs: list[int]):
+        self.id = workerID
+        self.shardIDs = shardIDs
+        self.process = None
+        self.restarts = 0
+        self.report = {}
+        self.reportedAt = None
+
+    @property
+    def alive(self):
+        return bool(self.process and self.process.is_alive())
+
+class _WorkerChip(Chip):
+    """ A `Chip` that periodically reports the health of its shards to the
+        supervisor. """
+
+    def __init__(self,
+        workerID: int,
+        reports: "mp.Queue[dict[str, Any]]",
+        interval: float,
+        dispatcher: Dispatcher | None
+    ):
+        super().__init__(dispatcher)
+        self.workerID = workerID
+        self.reports = reports
+        self.interval = interval
+
+    def getcoros(self):
+        return super().getcoros() + (
+            self._loop_report(),
+        )
+
+    async def _loop_report(self):
+        while self.running.is_set():
+            core = self.core
+            self.reports.put({
+                "worker": self.workerID,
+                "pid": os.getpid(),
+                "shards": core.shardStatus(),
+                "latency": core.latency,
+                "queued": core.recvQueue.qsize(),
+                "shed": dict(core.recvQueue.shed),
+                "dispatch": self.dispatcher.stats(),
+            })
+            await asyncio.sleep(self.interval)
+
+def _terminate(signum: int, frame: Any):
+    """ Stops a worker like a ctrl+c does when `Cluster.stop` terminates it, so
+        that the `Chip` shuts down its offload pools on the way out. Any
+        further terminates are ignored while it does. """
+
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt()
+
+def _runWorker(
+    workerID: int,
+    porys: list[t_PoryFactory],
+    token: str,
+    intents: int | Literal["auto"],
+    count: int,
+    shardIDs: list[int],
+    options: dict[str, Any],
+    reports: "mp.Queue[dict[str, Any]]",
+    interval: float,
+    dispatcher: t_DispatcherFactory | None
+):
+    signal.signal(signal.SIGTERM, _terminate)
+    chip = _WorkerChip(workerID, reports, interval, dispatcher() if dispatcher else None)
+    for makePory in porys:
+        makePory().use(chip)
+    chip.start(token, intents, shards=count, shardIDs=shardIDs, **options)
+
+class Cluster:
+    """ Runs a bot's shards across several worker processes on one machine, so
+        that payload parsing and handling isn't limited to one core.
+
+        Each worker runs its own `Chip` with a group of the shards and its own
+        instance of each `Pory`. `porys` is a list of classes (or other
+        picklable callables) that make those `Pory`s - they have to be
+        importable from the worker, so define them at module level. The same
+        goes for `dispatcher`, which makes each worker's `Dispatcher`.
+
+        The supervisor restarts workers that exit and collects the health
+        reports they send every `interval` seconds, which can be read with
+        `.health`.
+
+        Workers aren't daemonic, so that they can start processes of their own
+        for handlers that `offload` to processes. They're terminated on
+        `.stop`, and killed if they don't exit within `restartDelay` seconds.
+
+        Workers take turns identifying through lock files in a shared
+        directory (`identifyLockDir`, a temporary one by default), so that
+        Discord's identify concurrency limit holds across the whole cluster. """
+
+    doDebug: ClassVar = True
+
+    porys: list[t_PoryFactory]
+    token: str
+    intents: int | Literal["auto"]
+    shards: int | Literal["auto"]
+    dispatcher: t_DispatcherFactory | None
+    # Keyword arguments passed on to each worker's `Chip.start`
+    options: dict[str, Any]
+
+    workers: dict[int, Worker]
+
+    def __init__(self,
+        porys: list[t_PoryFactory],
+        token: str,
+        intents: int | Literal["auto"],
+        shards: int | Literal["auto"]="auto",
+        processes: int | None=None,
+        interval: float=5,
+        restartDelay: float=5,
+        dispatcher: t_DispatcherFactory | None=None,
+        **options: Any
+    ):
+        self.porys = porys
+        self.token = token
+        self.intents = intents
+        self.shards = shards
+        self.processes = processes if processes else os.cpu_count() or 1
+        self.interval = interval
+        self.restartDelay = restartDelay
+        self.dispatcher = dispatcher
+        self.options = options
+
+        self.workers = {}
+        self._ctx = mp.get_context("spawn")
+        self._reports: "mp.Queue[dict[str, Any]]" = self._ctx.Queue()
+        self._running = False
+
+    def debug(self, *message):
+        """ Prints to the console debugging messages if `.doDebug` is True. """
+
+        if self.doDebug:
+            print(*message)
+
+    def _spawn(self, worker: Worker, count: int):
+        worker.process = self._ctx.Process(
+            target=_runWorker,
+            args=(
+                worker.id, self.porys, self.token, self.intents,
+                count, worker.shardIDs, self.options, self._reports, self.interval,
+                self.dispatcher
+            ),
+            name=f"dubious-worker-{worker.id}"
+        )
+        worker.process.start()
+        self.debug(f"worker {worker.id} started with shards {worker.shardIDs} (pid {worker.process.pid})")
+
+    def _collect(self, timeout: float):
+        """ Takes in the reports sent by the workers for up to `timeout`
+            seconds. """
+
+        end = time.monotonic() + timeout
+        while (remaining := end - time.monotonic()) > 0:
+            try:
+                report = self._reports.get(timeout=remaining)
+            except queue.Empty:
+                return
+            worker = self.workers.get(report["worker"])
+            if worker:
+                worker.report = report
+                worker.reportedAt = time.time()
+
+    def health(self):
+        """ Gets the latest health of every worker by worker ID. """
+
+        return {
+            worker.id: {
+                "alive": worker.alive,
+                "pid": worker.process.pid if worker.process else None,
+                "restarts": worker.restarts,
+                "shards": worker.report.get("shards", {}),
+                "latency": worker.report.get("latency"),
+                "queued": worker.report.get("queued"),
+                "shed": worker.report.get("shed", {}),
+                "dispatch": worker.report.get("dispatch", {}),
+                "reportedAt": worker.reportedAt,
+            } for worker in self.workers.values()
+        }
+
+    def start(self):
+        """ Starts a worker process for each group of shards, then supervises
+            them until a `KeyboardInterrupt` happens. """
+
+        count = self.shards
+        if not isinstance(count, int) or self.options.get("maxConcurrency") is None:
+            gateway = asyncio.run(ShardManager(self.token, 0).fetchGateway())
+            if not isinstance(count, int):
+                count = gateway.shards
+            if self.options.get("maxConcurrency") is None:
+                self.options["maxConcurrency"] = gateway.session_start_limit.max_concurrency
+        if not self.options.get("identifyLockDir"):
+            self.options["identifyLockDir"] = tempfile.mkdtemp(prefix="dubious-identify-")
+        processes = min(self.processes, count)
+        self.workers = {
+            workerID: Worker(workerID, list(range(workerID, count, processes)))
+            for workerID in range(processes)
+        }
+
+        self._running = True
+        for worker in self.workers.values():
+            self._spawn(worker, count)
+
+        dead: dict[int, float] = {}
+        try:
+            while self._running:
+                self._collect(1)
+                for worker in self.workers.values():
+                    if worker.alive: continue
+                    if not worker.id in dead:
+                        self.debug(f"worker {worker.id} exited with code {worker.process.exitcode}, restarting in {self.restartDelay}s")
+                        dead[worker.id] = time.monotonic() + self.restartDelay
+                    elif time.monotonic() >= dead[worker.id]:
+                        del dead[worker.id]
+                        worker.restarts += 1
+                        self._spawn(worker, count)
+        except KeyboardInterrupt:
+            self.debug("ctrl+c, stopping workers")
+        finally:
+            self.stop()
+
+    def stop(self):
+        """ Stops supervising and terminates every worker. """
+
+        self._running = False
+        for worker in self.workers.values():
+            if worker.alive:
+                worker.process.terminate()
+        for worker in self.workers.values():
+            if worker.process:
+                worker.process.join(self.restartDelay)
+        for worker in self.workers.values():
+            if worker.alive:
+                self.debug(f"worker {worker.id} didn't exit, killing it")
+                worker.process.kill()
+                worker.process.join()
@@ -0,0 +1,338 @@
+import asyncio
+import time
+import traceback
+from collections import OrderedDict, deque
+from typing import Any, Callable, ClassVar, Coroutine, Literal, Sequence
+
+from dubious.discord import api, enums
+from dubious.discord.queues import RecvQueue
+
+t_Handler = Callable[
+    [enums.codes, api.Payload],
+        Coroutine[Any, Any, None]]
+
+class Dispatcher:
+    """ Decides how a `Chip` runs the handlers for each payload it recieves.
+
+        This one runs them one event at a time: every handler for an event is
+        awaited, in order, before the next event is looked at. An error in a
+        handler goes up to the `Chip`, which restarts. """
+
+    doDebug: ClassVar = True
+
+    # Events whose handlers are running right now
+    inFlight: int
+    # The most events that were ever in flight at once
+    peakInFlight: int
+    dispatched: int
+    failed: int
+
+    def __init__(self):
+        self.inFlight = 0
+        self.peakInFlight = 0
+        self.dispatched = 0
+        self.failed = 0
+        self._inFlightByCode: dict[enums.codes, int] = {}
+
+    def debug(self, *message):
+        """ Prints to the console debugging messages if `.doDebug` is True. """
+
+        if self.doDebug:
+            print(*message)
+
+    def inFlightByCode(self):
+        """ Gets the number of events in flight by their code. """
+
+        return dict(self._inFlightByCode)
+
+    def stats(self):
+        return {
+            "inFlight": self.inFlight,
+            "peakInFlight": self.peakInFlight,
+            "dispatched": self.dispatched,
+            "failed": self.failed,
+            "byCode": self.inFlightByCode(),
+        }
+
+    async def _run(self, handlers: Sequence[t_Handler], code: enums.codes, payload: api.Payload):
+        """ Runs every handler for one event in order, keeping count of what's
+            in flight. """
+
+        self.inFlight += 1
+        self.peakInFlight = max(self.peakInFlight, self.inFlight)
+        self._inFlightByCode[code] = self._inFlightByCode.get(code, 0) + 1
+        try:
+            for handler in handlers:
+                await handler(code, payload)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.inFlight -= 1
+            self.dispatched += 1
+            if self._inFlightByCode[code] == 1:
+                del self._inFlightByCode[code]
+            else:
+                self._inFlightByCode[code] -= 1
+
+    async def _runQuietly(self, handlers: Sequence[t_Handler], code: enums.codes, payload: api.Payload):
+        """ Runs every handler for one event, printing an error instead of
+            raising it. """
+
+        try:
+            await self._run(handlers, code, payload)
+        except Exception as e:
+            self.debug(*traceback.format_exception(e))
+
+    async def dispatch(self, handlers: Sequence[t_Handler], code: enums.codes, payload: api.Payload):
+        """ Called by `Chip._loop_dispatch` for each event. Returns when the
+            `Chip` can move on to the next event. """
+
+        await self._run(handlers, code, payload)
+
+    async def close(self):
+        """ Waits for any handlers still running, when the `Chip` stops. """
+
+class ConcurrentDispatcher(Dispatcher):
+    """ Runs the handlers for up to `limit` events at once, each event in its
+        own task, so that one slow handler doesn't hold up every other event.
+
+        The handlers for a single event still run one after another, in their
+        usual order. Once `limit` events are in flight, the `Chip` waits for
+        one to finish before taking the next payload from the recv queue.
+
+        An error in a handler is printed and counted in `.failed` rather than
+        restarting the `Chip`. On stop, handlers get `drainTimeout` seconds to
+        finish before they're cancelled. """
+
+    limit: int
+    drainTimeout: float
+    # Seconds spent waiting for a free slot
+    saturated: float
+
+    def __init__(self, limit: int=64, drainTimeout: float=10):
+        super().__init__()
+        self.limit = limit
+        self.drainTimeout = drainTimeout
+        self.saturated = 0
+
+        self._slots = asyncio.Semaphore(limit)
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def stats(self):
+        return super().stats() | {
+            "limit": self.limit,
+            "saturated": self.saturated,
+        }
+
+    async def dispatch(self, handlers: Sequence[t_Handler], code: enums.codes, payload: api.Payload):
+        if self._slots.locked():
+            start = time.perf_counter()
+            await self._slots.acquire()
+            self.saturated += time.perf_counter() - start
+        else:
+            await self._slots.acquire()
+
+        task = asyncio.create_task(self._runInSlot(handlers, code, payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _runInSlot(self, handlers: Sequence[t_Handler], code: enums.codes, payload: api.Payload):
+        try:
+            await self._runQuietly(handlers, code, payload)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        if not self._tasks: return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=self.drainTimeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+t_Event = tuple[Sequence[t_Handler], enums.codes, api.Payload]
+
+class _Partition:
+    """ The events waiting for one worker of a `PartitionedDispatcher`, kept
+        in a queue per key. The worker takes one event from each key in turn. """
+
+    def __init__(self):
+        self.queues: OrderedDict[Any, deque[t_Event]] = OrderedDict()
+        self.depth = 0
+        self.pushed = asyncio.Event()
+
+    def waiting(self, key: Any):
+        """ Gets the number of events waiting for a key. """
+
+        queue = self.queues.get(key)
+        return len(queue) if queue else 0
+
+    def put(self, key: Any, event: t_Event):
+        if not key in self.queues:
+            self.queues[key] = deque()
+        self.queues[key].append(event)
+        self.depth += 1
+        self.pushed.set()
+
+    def take(self):
+        key, queue = next(iter(self.queues.items()))
+        event = queue.popleft()
+        # The key goes to the back of the line, behind every other key here.
+        if queue:
+            self.queues.move_to_end(key)
+        else:
+            del self.queues[key]
+        self.depth -= 1
+        return event
+
+class PartitionedDispatcher(Dispatcher):
+    """ Spreads events over `partitions` workers by their guild (or channel,
+        depending on `by`), so that events for the same guild are handled in
+        the order they came in while different guilds are handled in parallel.
+
+        Within a partition, each guild gets its own queue, and the worker takes
+        one event from each in turn, so that a noisy guild can't starve the
+        others that share its partition. Events with no guild or channel (like
+        Ready) all share one key.
+
+        At most `maxQueued` events wait across all partitions (or any number,
+        if 0) before the `Chip` waits for room. If `maxPerKey` is set, a guild
+        with that many events waiting has its new `RecvQueue.lowPriority`
+        events (typing and presences) dropped and counted in `.shed`, so that
+        one guild flooding in takes up less of that room. Every other event is
+        always handled.
+
+        As with the `ConcurrentDispatcher`, errors are printed rather than
+        raised, and handlers get `drainTimeout` seconds to finish on stop. """
+
+    # Events where `id` is the guild's or the channel's ID
+    guildEvents: ClassVar = frozenset({enums.tcode.GuildCreate, enums.tcode.GuildUpdate, enums.tcode.GuildDelete})
+    channelEvents: ClassVar = frozenset({enums.tcode.ChannelCreate, enums.tcode.ChannelUpdate, enums.tcode.ChannelDelete})
+
+    partitions: int
+    by: Literal["guild", "channel"]
+    maxQueued: int
+    maxPerKey: int
+    drainTimeout: float
+    # Seconds spent waiting for room
+    saturated: float
+    # Low priority events dropped for being over `maxPerKey`, by event name
+    shed: dict[str, int]
+
+    def __init__(self,
+        partitions: int=16,
+        by: Literal["guild", "channel"]="guild",
+        maxQueued: int=10000,
+        maxPerKey: int=0,
+        drainTimeout: float=10
+    ):
+        super().__init__()
+        self.partitions = partitions
+        self.by = by
+        self.maxQueued = maxQueued
+        self.maxPerKey = maxPerKey
+        self.drainTimeout = drainTimeout
+        self.saturated = 0
+        self.shed = {}
+
+        self._partitions = [_Partition() for _ in range(partitions)]
+        self._queued = 0
+        self._workers: list[asyncio.Task[None]] = []
+        self._notFull = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def queued(self):
+        """ The number of events waiting across all partitions. """
+
+        return self._queued
+
+    def depths(self):
+        """ Gets the number of events waiting in each partition. """
+
+        return {i: partition.depth for i, partition in enumerate(self._partitions)}
+
+    def keys(self):
+        """ Gets the number of guilds (or channels) with events waiting in each
+            partition. """
+
+        return {i: len(partition.queues) for i, partition in enumerate(self._partitions)}
+
+    def stats(self):
+        return super().stats() | {
+            "queued": self.queued,
+            "saturated": self.saturated,
+            "shed": dict(self.shed),
+            "depths": self.depths(),
+        }
+
+    def key(self, code: enums.codes, payload: api.Payload):
+        """ Gets what an event is ordered by: its guild or channel ID. """
+
+        d = payload.d
+        if not isinstance(d, dict): return None
+        guildID = d.get("guild_id") or (d.get("id") if code in self.guildEvents else None)
+        channelID = d.get("channel_id") or (d.get("id") if code in self.channelEvents else None)
+        if self.by == "channel":
+            return channelID or guildID
+        return guildID or channelID
+
+    def _startWorkers(self):
+        if self._workers: return
+        self._workers = [
+            asyncio.create_task(self._loop_work(partition)) for partition in self._partitions
+        ]
+
+    async def dispatch(self, handlers: Sequence[t_Handler], code: enums.codes, payload: api.Payload):
+        self._startWorkers()
+
+        key = self.key(code, payload)
+        partition = self._partitions[hash(key) % self.partitions]
+        if (
+            self.maxPerKey and key is not None and code in RecvQueue.lowPriority
+            and partition.waiting(key) >= self.maxPerKey
+        ):
+            name = code.value if isinstance(code, enums.tcode) else str(code)
+            self.shed[name] = self.shed.get(name, 0) + 1
+            return
+
+        if self.maxQueued and self.queued >= self.maxQueued:
+            start = time.perf_counter()
+            while self.queued >= self.maxQueued:
+                self._notFull.clear()
+                await self._notFull.wait()
+            self.saturated += time.perf_counter() - start
+
+        self._idle.clear()
+        partition.put(key, (handlers, code, payload))
+        self._queued += 1
+
+    async def _loop_work(self, partition: _Partition):
+        while True:
+            if not partition.depth:
+                if not self.inFlight and not self.queued:
+                    self._idle.set()
+                partition.pushed.clear()
+                await partition.pushed.wait()
+                continue
+
+            handlers, code, payload = partition.take()
+            self._queued -= 1
+            self._notFull.set()
+            await self._runQuietly(handlers, code, payload)
+
+    async def close(self):
+        if not self._workers: return
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.drainTimeout)
+        except asyncio.TimeoutError:
+            pass
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # Anything that didn't get handled in time is dropped.
+        self._partitions = [_Partition() for _ in range(self.partitions)]
+        self._queued = 0
+        self._idle.set()
@@ -1,5 +1,7 @@
 
-from typing import Any, Callable, Coroutine
+import asyncio
+from typing import Any, Callable, ClassVar, Coroutine
+
 from dubious.discord import api, enums, make, rest
 
 def makeIxn(ixn: api.Interaction, http: rest.Http):
@@ -48,6 +50,8 @@ class Ixn:
     ):
         if not silent:
             response = self._castResponse(response)
+            if private and isinstance(response.data, make.RMessage):
+                response.data = response.data.copy(update={"flags": enums.MessageFlags.Ephemeral})
             return await using(response)
         else:
             response = self._castData(response)
@@ -116,3 +120,96 @@ class GuildIxn(Ixn):
         self.guildID = ixn.guild_id
         self.channelID = ixn.channel_id
         self.member = ixn.member
+
+class IxnRelay:
+    """ Makes the calls that an `OffloadedIxn` sends back, on the real `Ixn`
+        and on the event loop, while the offloaded function is still running.
+
+        If nothing has responded `deferAfter` seconds into the function,
+        the response is deferred so that Discord's deadline for the initial
+        response isn't missed. A `.respond` after that edits the deferred
+        response instead - or, if it's private, is sent as a private followup
+        and the public deferred response is deleted. """
+
+    deferAfter: ClassVar = 2.0
+
+    ixn: Ixn
+    responded: bool
+    deferred: bool
+
+    def __init__(self, ixn: Ixn):
+        self.ixn = ixn
+        self.responded = False
+        self.deferred = False
+        self._lock = asyncio.Lock()
+        self._deferring: asyncio.Task[None] | None = None
+
+    def start(self):
+        self._deferring = asyncio.create_task(self._deferLater())
+
+    async def stop(self):
+        if not self._deferring: return
+        # A deferral that's already being sent holds the lock, and is left to
+        #  finish.
+        async with self._lock:
+            self._deferring.cancel()
+        await asyncio.gather(self._deferring, return_exceptions=True)
+
+    async def _deferLater(self):
+        await asyncio.sleep(self.deferAfter)
+        async with self._lock:
+            if self.responded: return
+            await self.ixn._http.postInteractionResponse(self.ixn._ixn.id, self.ixn._ixn.token, make.Response(
+                type=enums.InteractionResponseTypes.CmdAckAndEdit,
+                data=make.RMessage()
+            ))
+            self.responded = self.deferred = True
+
+    async def perform(self, name: str, args: tuple[Any, ...], kwargs: dict[str, Any]):
+        """ Makes one call on the real `Ixn` and returns what it returned. """
+
+        async with self._lock:
+            if name == "respond" and self.deferred:
+                if not kwargs.get("private"):
+                    return await self.ixn.edit(args[0])
+                message = await self.ixn.followup(*args, **kwargs)
+                await self.ixn._http.deleteInteractionMessage(self.ixn._ixn.token)
+                return message
+            result = await getattr(self.ixn, name)(*args, **kwargs)
+            if name == "respond":
+                self.responded = True
+            return result
+
+class OffloadedIxn:
+    """ Stands in for an `Ixn` in a function run with `offload`, where the
+        `Ixn`'s http connection can't be used. Has the same attributes as the
+        `Ixn` it was made from, minus the http connection.
+
+        Calls to `.respond`, `.followup` and `.edit` (and `.guild` and
+        `.channel`, if the `Ixn` is a `GuildIxn`) are sent back through `link`
+        as they're made, to be made on the real `Ixn` by an `IxnRelay`. They
+        return what the real `Ixn` returned. """
+
+    t_Link = Callable[[str, tuple[Any, ...], dict[str, Any]], Coroutine[Any, Any, Any]]
+
+    def __init__(self, ixn: Ixn, link: t_Link):
+        self.__dict__.update({k: v for k, v in ixn.__dict__.items() if k != "_http"})
+        self._isGuild = isinstance(ixn, GuildIxn)
+        self._link = link
+
+    async def edit(self, response: Ixn.t_Response, id: api.Snowflake | rest.t_Original=enums.IxnOriginal):
+        return await self._link("edit", (response, id), {})
+
+    async def respond(self, response: Ixn.t_Response, *, silent=False, private=False):
+        return await self._link("respond", (response,), {"silent": silent, "private": private})
+
+    async def followup(self, response: Ixn.t_Response, *, silent=False, private=False):
+        return await self._link("followup", (response,), {"silent": silent, "private": private})
+
+    async def guild(self) -> api.Guild:
+        if not self._isGuild: raise AttributeError("Only interactions from a guild have a guild.")
+        return await self._link("guild", (), {})
+
+    async def channel(self) -> api.Channel:
+        if not self._isGuild: raise AttributeError("Only interactions from a guild have a channel.")
+        return await self._link("channel", (), {})
@@ -9,6 +9,7 @@ from pydantic import Field, PrivateAttr
 from dubious.Interaction import Ixn
 
 from dubious.discord import api, enums, make
+from dubious.Offload import Offloader, t_Offload
 from dubious.Register import Meta, Register, t_Callable
 
 class Handle(Register):
@@ -20,10 +21,22 @@ class Handle(Register):
     # The lower the prio value, the sooner the handler is called.
     order: int
     # This only applies to the ordering of handlers within one class - handlers of any superclass will always be called first.
-
-    def __init__(self, ident: enums.codes, order=0):
+    # Passive handlers don't count towards the intents a `Chip` works out for
+    #  itself - they're only called if something else asks for their events.
+    passive: bool
+    # Runs the function in a thread or process pool instead of on the event
+    #  loop - see `Offloader`. Whatever it returns is thrown away.
+    offload: t_Offload | None
+    # Raw handlers are given the `api.Payload` as it came in, without its data
+    #  being parsed into a model - for handlers that only need a field or two.
+    raw: bool
+
+    def __init__(self, ident: enums.codes, order=0, passive=False, offload: t_Offload | None=None, raw=False):
         self.code = ident
         self.order = order
+        self.passive = passive
+        self.offload = offload
+        self.raw = raw
 
     def reference(self):
         return self.code
@@ -93,6 +106,9 @@ class Machine(Register[str], make.CommandPart, HasChecks):
         arbitrary_types_allowed = True
 
     _andChecks: list[Check] = PrivateAttr(default_factory=list)
+    # Runs the function in a thread or process pool instead of on the event
+    #  loop - see `Offloader`. Kept private so it isn't sent to Discord.
+    _offload: t_Offload | None = PrivateAttr(None)
 
     def reference(self):
         return self.name
@@ -120,7 +136,10 @@ class Machine(Register[str], make.CommandPart, HasChecks):
                 subcommandKwargs = kwargs.pop(option.name)
                 break
 
-        results = await self.teg()(ownerSelf, ixn, *args, **kwargs)
+        if self._offload:
+            results = await Offloader.shared.runWithIxn(self._offload, self.teg(), ownerSelf, ixn, *args, **kwargs)
+        else:
+            results = await self.teg()(ownerSelf, ixn, *args, **kwargs)
         if not isinstance(results, tuple):
             results = (results,) if results is not None else tuple()
 
@@ -136,16 +155,19 @@ class Machine(Register[str], make.CommandPart, HasChecks):
         description: str,
         type: enums.ApplicationCommandTypes | enums.CommandOptionTypes,
         options: list[make.CommandPart] | None=None,
+        offload: t_Offload | None=None,
     **kwargs) -> Self:
         """ Constructs this Machine without the need for kwargs. """
 
-        return cls(
+        machine = cls(
             name=name,
             description=description,
             type=type,
             options=options if options else [],
             **kwargs
         )
+        machine._offload = offload
+        return machine
 
     def getOptionsByName(self):
         """ Returns a mapped dict of the name of each option in this Machine to
@@ -178,13 +200,15 @@ class Command(Machine, make.Command):
         name: str,
         description: str,
         options: list[make.CommandPart] | None=None,
-        guildID: api.Snowflake | int | str | None=None
+        guildID: api.Snowflake | int | str | None=None,
+        offload: t_Offload | None=None
     ):
         return super().new(
             name=name,
             description=description,
             type=enums.ApplicationCommandTypes.ChatInput,
             options=options if options else [],
+            offload=offload,
             guildID=api.Snowflake(guildID) if guildID else None,
         )
 
@@ -195,11 +219,13 @@ class Subcommand(Machine, make.CommandOption):
         name: str,
         description: str,
         options: list[make.CommandPart] | None=None,
+        offload: t_Offload | None=None
     ):
         return super().new(
             name=name,
             description=description,
             type=enums.CommandOptionTypes.SubCommand,
+            offload=offload,
             required=None,
             options=options if options else [],
             choices=[]
@@ -0,0 +1,169 @@
+import asyncio
+import inspect
+import multiprocessing as mp
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.managers import SyncManager
+from typing import Any, Callable, ClassVar, Literal
+
+from dubious.Interaction import Ixn, IxnRelay, OffloadedIxn
+
+t_Offload = Literal["process", "thread"]
+
+def _call(fn: Callable[..., Any], args: tuple[Any, ...], kwargs: dict[str, Any]):
+    """ Runs a function in the executor. Coroutine functions get an event loop
+        of their own to run on. """
+
+    res = fn(*args, **kwargs)
+    if inspect.iscoroutine(res):
+        res = asyncio.run(res)
+    return res
+
+class _ThreadLink:
+    """ Sends an `OffloadedIxn`'s calls from a worker thread to the `IxnRelay`
+        on the event loop, and waits for each to be made. """
+
+    def __init__(self, relay: IxnRelay, loop: asyncio.AbstractEventLoop):
+        self.relay = relay
+        self.loop = loop
+
+    async def __call__(self, name: str, args: tuple[Any, ...], kwargs: dict[str, Any]):
+        future = asyncio.run_coroutine_threadsafe(self.relay.perform(name, args, kwargs), self.loop)
+        return await asyncio.wrap_future(future)
+
+class _QueueLink:
+    """ Sends an `OffloadedIxn`'s calls from a worker process to the `IxnRelay`
+        on the event loop through a pair of manager queues, and waits for each
+        to be made. Errors come back as `RuntimeError`s, since they may not
+        survive being pickled. """
+
+    def __init__(self, calls: Any, results: Any):
+        self.calls = calls
+        self.results = results
+        # Made in the worker process, on the function's own event loop.
+        self._lock: asyncio.Lock | None = None
+
+    async def __call__(self, name: str, args: tuple[Any, ...], kwargs: dict[str, Any]):
+        if not self._lock: self._lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        # Calls are made one at a time, so each result is for the last call.
+        async with self._lock:
+            await loop.run_in_executor(None, self.calls.put, (name, args, kwargs))
+            ok, result = await loop.run_in_executor(None, self.results.get)
+        if not ok: raise RuntimeError(result)
+        return result
+
+async def _serve(relay: IxnRelay, calls: Any, results: Any):
+    """ Makes the calls a `_QueueLink` sends, until it sends None. """
+
+    loop = asyncio.get_running_loop()
+    while True:
+        call = await loop.run_in_executor(None, calls.get)
+        if call is None: return
+        name, args, kwargs = call
+        try:
+            result = (True, await relay.perform(name, args, kwargs))
+        except Exception as e:
+            result = (False, f"{e.__class__.__name__}: {e}")
+        await loop.run_in_executor(None, results.put, result)
+
+class Offloader:
+    """ Runs `Handle` and `Command` functions marked with `offload` away from
+        the event loop, so that CPU-heavy work doesn't hold up heartbeats and
+        other events.
+
+        "thread" runs the function in a thread pool, which is enough for work
+        that lets go of the GIL (most image and compression libraries do).
+        "process" runs it in a pool of `processes` worker processes. Arguments
+        and results are pickled to get there, which includes the `Pory` the
+        function belongs to (without its `chip` and `http`) - so changes the
+        function makes to the `Pory` don't come back.
+
+        One `Offloader` is shared by the whole process (`.shared`). The pools
+        are made when first needed, along with a manager process for sending
+        `OffloadedIxn` calls back from worker processes. """
+
+    shared: ClassVar["Offloader"]
+
+    processes: int | None
+    threads: int | None
+
+    def __init__(self, processes: int | None=None, threads: int | None=None):
+        self.processes = processes
+        self.threads = threads
+
+        self._executors: dict[t_Offload, Executor] = {}
+        self._manager: SyncManager | None = None
+
+    def _checkCanSpawn(self):
+        if mp.current_process().daemon:
+            raise RuntimeError("Can't offload to a process from a daemonic process, since it can't have children. Offload to a thread instead.")
+
+    def executor(self, mode: t_Offload):
+        """ Gets the pool for a mode, making it if it doesn't exist yet. """
+
+        if not mode in self._executors:
+            if mode == "process":
+                self._checkCanSpawn()
+                self._executors[mode] = ProcessPoolExecutor(
+                    self.processes if self.processes else os.cpu_count(),
+                    mp_context=mp.get_context("spawn")
+                )
+            else:
+                self._executors[mode] = ThreadPoolExecutor(self.threads, thread_name_prefix="dubious-offload")
+        return self._executors[mode]
+
+    async def run(self, mode: t_Offload, fn: Callable[..., Any], *args: Any, **kwargs: Any):
+        """ Runs a function in the pool for `mode` and waits for its result. """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor(mode), _call, fn, args, kwargs)
+
+    def manager(self):
+        """ Gets the manager process, starting it if it isn't running yet. """
+
+        if not self._manager:
+            self._checkCanSpawn()
+            self._manager = mp.get_context("spawn").Manager()
+        return self._manager
+
+    async def runWithIxn(self, mode: t_Offload, fn: Callable[..., Any], ownerSelf: Any, ixn: Ixn, *args: Any, **kwargs: Any):
+        """ Runs a `Machine`'s function in the pool for `mode`, giving it an
+            `OffloadedIxn` in place of the `Ixn`. The responses it makes are
+            sent through the real `Ixn` here on the event loop as they're
+            made, and the response is deferred if the function takes too long
+            to make one - see `IxnRelay`. """
+
+        loop = asyncio.get_running_loop()
+        relay = IxnRelay(ixn)
+        server = None
+        if mode == "thread":
+            offloaded = OffloadedIxn(ixn, _ThreadLink(relay, loop))
+        else:
+            manager = self.manager()
+            calls, results = manager.Queue(), manager.Queue()
+            offloaded = OffloadedIxn(ixn, _QueueLink(calls, results))
+            server = asyncio.create_task(_serve(relay, calls, results))
+
+        relay.start()
+        try:
+            return await loop.run_in_executor(self.executor(mode),
+                _call, fn, (ownerSelf, offloaded, *args), kwargs
+            )
+        finally:
+            if server:
+                calls.put(None)
+                await server
+            await relay.stop()
+
+    def shutdown(self):
+        """ Shuts down the pools without waiting for running functions. """
+
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = {}
+        if self._manager:
+            self._manager.shutdown()
+            self._manager = None
+
+Offloader.shared = Offloader()
@@ -1,19 +1,24 @@
 
 import asyncio
+import functools
 import math
 import re
-from typing import Any, Callable, ClassVar, Coroutine, TypeGuard, TypeVar
+import warnings
+from typing import Any, Callable, ClassVar, Coroutine, Literal, TypeGuard, TypeVar
 from typing_extensions import Self
 from dubious.GuildStructure import Item, Many, One, Structure
 
-from dubious.discord import api, enums, make, rest
+from dubious.discord import api, enums, intents as gatewayIntents, make, rest
 from dubious.discord.core import Core, Discore
+from dubious.discord.identify import IdentifyScheduler
+from dubious.discord.queues import RecvQueue, t_RecvPolicy
+from dubious.discord.recording import Recorder
+from dubious.discord.replay import Replayer
+from dubious.discord.shards import ShardManager
+from dubious.Dispatch import Dispatcher, t_Handler
 from dubious.Interaction import Ixn
 from dubious.Machines import Command, Handle, Machine, Option, Subcommand
-
-t_Handler = Callable[
-    [enums.codes, api.Payload],
-        Coroutine[Any, Any, None]]
+from dubious.Offload import Offloader
 
 class Chip(Core):
     """ Handles the connection to Discord and other core functionalities.
@@ -21,20 +26,43 @@ class Chip(Core):
         Uses a Discore to connect to Discord, and has the same protocols for
         running loops in (mock) parallel. Handler functions can be added to a
         Chip that get called whenever a payload is recieved from Discord through
-        the Discore. """
+        the Discore.
+
+        When started with `shards`, a `ShardManager` takes the place of the
+        Discore. When replaying a recording, a `Replayer` does.
+
+        How the handlers for each payload are run is up to the `dispatcher` -
+        by default, one payload at a time. See `ConcurrentDispatcher`.
 
-    _core: Discore
-    _handlers: list[t_Handler]
+        The handlers of every attached `Pory` (and every function added with
+        `.addHandler`) are compiled into one table from code to handlers,
+        which is rebuilt whenever something is attached. """
+
+    _core: Discore | ShardManager | Replayer
+    # Attached `Pory`s and handler functions, in the order they were added
+    _attached: "list[Pory | t_Handler]"
+    # The handlers to call for each code, in order
+    _table: dict[enums.codes, tuple[t_Handler, ...]]
+    # The handlers to call for codes no `Pory` handles
+    _everyCode: tuple[t_Handler, ...]
+    dispatcher: Dispatcher
 
     running: asyncio.Event
 
-    def __init__(self):
-        self._handlers = []
+    def __init__(self, dispatcher: Dispatcher | None=None):
+        self._attached = []
+        self._table = {}
+        self._everyCode = ()
+        self.dispatcher = dispatcher if dispatcher else Dispatcher()
 
     @property
     def chip(self): return self
     @property
     def core(self): return self._core
+    @property
+    def latency(self): return self._core.latency
+    @property
+    def latencyWindow(self): return self._core.latencyWindow
 
     def getcoros(self):
         return self._core.getcoros() + (
@@ -45,40 +73,189 @@ class Chip(Core):
         await self.running.wait()
 
         while self.running.is_set():
-            payload = await self.runWithTimeout(self._core.recv())
-            if payload is False: continue
+            payload = await self._core.recv()
 
             code = payload.t if payload.t else payload.op
             if not isinstance(code, (enums.opcode, enums.tcode)): continue
 
-            for handler in self._handlers:
-                await handler(code, payload)
+            handlers = self._table.get(code, self._everyCode)
+            if not handlers: continue
+            await self.dispatcher.dispatch(handlers, code, payload)
 
     def set(self):
         self.running.set()
+        self._core.set()
 
     def isRunning(self):
         return self.running.is_set()
 
     def clear(self):
         self.running.clear()
+        self._core.clear()
 
     async def close(self):
+        # Handlers are left running through a restart.
+        if not self.isRunning():
+            await self.dispatcher.close()
+            Offloader.shared.shutdown()
+            await asyncio.gather(*(pory.close() for pory in self._attached if isinstance(pory, Pory)))
         await self.core.close()
 
-    def start(self, token: str, intents: int):
+    def start(self,
+        token: str,
+        intents: int | Literal["auto"],
+        compress: bool=False,
+        encoding: Literal["json", "etf"]="json",
+        sessionPath: str | None=None,
+        shards: int | Literal["auto"] | None=None,
+        shardIDs: list[int] | None=None,
+        uri: str | None=None,
+        queueSize: int=10000,
+        queuePolicy: t_RecvPolicy="block",
+        spillPath: str | None=None,
+        maxConcurrency: int | None=None,
+        identifyLockDir: str | None=None,
+        recordPath: str | None=None
+    ):
         """ Instantiates a `Discore` and starts it and itself. Until a
             `KeyboardInterrupt` happens, it will attempt to restart the
-            `Discore` and itself whenever an error is encountered. """
+            `Discore` and itself whenever an error is encountered.
+
+            With `intents` set to "auto", connects with the fewest intents
+            that the attached `Pory`s' handlers need (see `.requiredIntents`).
+            Otherwise, warns about any handler that the given intents keep
+            from ever being called.
+
+            If `compress` is set, the gateway connection uses zlib-stream
+            transport compression. `encoding` picks between JSON and ETF
+            payloads - ETF decodes slower than JSON and isn't any smaller
+            with compression (see `discord.etf`). If `sessionPath` is given, the gateway session is saved
+            there on close so that a restarted process can resume it.
+
+            If `shards` is given, connects with that many shards (or with as
+            many as Discord recommends, for "auto") through a `ShardManager`.
+            `shardIDs` limits which of those shards this `Chip` runs.
+
+            `uri` overrides the gateway to connect to.
 
+            At most `queueSize` payloads wait to be handled in memory. What
+            happens when there are more is decided by `queuePolicy` - see
+            `RecvQueue`.
+
+            Shards identify `maxConcurrency` at a time (fetched from Discord if
+            not given). If `identifyLockDir` is given, that limit is shared
+            with other processes using the same directory - see
+            `IdentifyScheduler`.
+
+            If `recordPath` is given, every frame recieved is appended to a
+            recording there, which can be played back with `.replay`. """
+
+        if intents == "auto":
+            intents = self.requiredIntents()
+            self.debug(f"intents: {gatewayIntents.describe(intents) or 'none'}")
+        else:
+            self.checkIntents(intents)
+
+        options: dict[str, Any] = dict(compress=compress, encoding=encoding, sessionPath=sessionPath)
+        if uri: options["uri"] = uri
+        options["rq"] = RecvQueue(queueSize, queuePolicy, spillPath)
+        if identifyLockDir:
+            options["identifier"] = IdentifyScheduler(lockDir=identifyLockDir)
+        recorder = options["recorder"] = Recorder(recordPath) if recordPath else None
         self.running = asyncio.Event()
-        self._core = Discore(token, intents)
-        super().start()
+        if shards is None and shardIDs is None:
+            self._core = Discore(token, intents, **options)
+        else:
+            count = shards if isinstance(shards, int) else None
+            self._core = ShardManager(token, intents, count, shardIDs, maxConcurrency=maxConcurrency, **options)
+        try:
+            super().start()
+        finally:
+            self._core.recvQueue.close()
+            if recorder: recorder.close()
+
+    def replay(self,
+        path: str,
+        speed: float | None=1,
+        token: str="",
+        queueSize: int=10000,
+        queuePolicy: t_RecvPolicy="block",
+        spillPath: str | None=None
+    ):
+        """ Handles the payloads in a recording made with `recordPath` instead
+            of connecting to Discord, then returns once all of them have been
+            handled. `speed` is relative to how fast they were recorded, or
+            `None` for as fast as possible. See `Replayer`. """
+
+        self.running = asyncio.Event()
+        self._core = Replayer(path, speed, RecvQueue(queueSize, queuePolicy, spillPath), token)
+        self._core.whenDone = self.stop
+        try:
+            super().start()
+        finally:
+            self._core.recvQueue.close()
+        return self._core
 
     def addHandler(self, func: t_Handler):
         """ Adds a function to be called whenever a Payload is recieved. """
 
-        self._handlers.append(func)
+        self._attached.append(func)
+        self._compile()
+
+    def attach(self, pory: "Pory"):
+        """ Adds a `Pory`'s `Handle`s to be called whenever a Payload with
+            their code is recieved. """
+
+        self._attached.append(pory)
+        self._compile()
+
+    def _handles(self):
+        """ Yields every attached `Pory` with each of its `Handle`s. """
+
+        for attached in self._attached:
+            if not isinstance(attached, Pory): continue
+            for handles in attached.__class__.handles.values():
+                for handle in handles:
+                    yield attached, handle
+
+    def requiredIntents(self):
+        """ Gets the fewest intents that get Discord to send the events that
+            the attached `Pory`s handle. Passive `Handle`s aren't counted, and
+            neither are `Command`s, which come through without any intents. """
+
+        return gatewayIntents.forCodes(handle.code for _, handle in self._handles() if not handle.passive)
+
+    def checkIntents(self, intents: int):
+        """ Warns about each attached `Handle` that will never be called,
+            because Discord won't send its event with the given intents. """
+
+        for pory, handle in self._handles():
+            if handle.passive or gatewayIntents.reaches(handle.code, intents): continue
+            needs = " or ".join(intent.name for intent in gatewayIntents.REQUIRED[handle.code]) # type: ignore
+            warnings.warn(
+                f"`{pory.__class__.__name__}.{handle.teg().__name__}` handles {handle.code.value}, "
+                f"which won't be sent without the {needs} intent.",
+                stacklevel=3
+            )
+
+    def _compile(self):
+        """ Rebuilds the table of handlers to call for each code. """
+
+        # One list of handlers per attached thing, by code
+        compiled: list[dict[enums.codes, list[t_Handler]] | t_Handler] = [
+            attached.handlers() if isinstance(attached, Pory) else attached
+            for attached in self._attached
+        ]
+        codes = {code for handlers in compiled if isinstance(handlers, dict) for code in handlers}
+
+        self._table = {
+            code: tuple(
+                handler
+                for handlers in compiled
+                for handler in (handlers.get(code, []) if isinstance(handlers, dict) else [handlers])
+            ) for code in codes
+        }
+        self._everyCode = tuple(handlers for handlers in compiled if not isinstance(handlers, dict))
 
 class Pory:
     """ A collection of `Handle`-wrapped methods that uses a Chip to handle
@@ -86,7 +263,9 @@ class Pory:
 
         Pre-defined is a method called when the `Chip` catches a `tcode.Ready`
         payload. This method sets the `Pory`'s `user`, its `guildIDs`, and its
-        `http` api connection. """
+        `http` api connection, which is closed when the `Chip` stops. Also
+        pre-defined are passive `Handle`s that drop guilds, channels and
+        messages from the `http`'s caches when Discord says they've changed. """
 
     handles: dict[enums.codes, list[Handle]]
 
@@ -119,16 +298,45 @@ class Pory:
             self.chip = chip.chip
         else:
             self.chip = chip
-        self.chip.addHandler(self._handle)
+        self.chip.attach(self)
         return self
 
-    async def _handle(self, code: enums.codes, payload: api.Payload):
-        handlers = self.__class__.handles.get(code)
-        if not handlers: return
+    def handlers(self):
+        """ Gets this `Pory`'s `Handle`s for each code, bound to it and ready
+            to be called by a `Chip` with the raw payload. """
 
-        d = api.castInner(payload)
-        for handler in handlers:
-            await handler.teg()(self, d)
+        return {
+            code: [self._bindHandle(
+                functools.partial(Offloader.shared.run, handle.offload, handle.teg(), self)
+                if handle.offload else handle.teg().__get__(self),
+                handle.raw
+            ) for handle in handles]
+            for code, handles in self.__class__.handles.items()
+        }
+
+    async def close(self):
+        """ Closes the `http` api connection. A new one is made on the next
+            Ready. """
+
+        http: rest.Http | None = self.__dict__.pop("http", None)
+        if http: await http.close()
+
+    def __getstate__(self):
+        # Offloading to a process pickles the `Pory`, but not its connections.
+        state = self.__dict__.copy()
+        state.pop("chip", None)
+        state.pop("http", None)
+        return state
+
+    @staticmethod
+    def _bindHandle(method: Callable[[Any], Coroutine[Any, Any, None]], raw: bool=False) -> t_Handler:
+        if raw:
+            async def rawHandler(code: enums.codes, payload: api.Payload):
+                await method(payload)
+            return rawHandler
+        async def handler(code: enums.codes, payload: api.Payload):
+            await method(api.castInner(payload))
+        return handler
 
     @Handle(enums.tcode.Ready, -100)
     async def ready(self, ready: api.Ready):
@@ -136,5 +344,62 @@ class Pory:
             api framework. """
 
         self._user = ready.user
-        self._guildIDs = {g.id for g in ready.guilds}
-        self.http = rest.Http(self.user.id, self.token)
+        guildIDs = {g.id for g in ready.guilds}
+        # Each shard sends its own Ready with only its own guilds.
+        if ready.shard and ready.shard[1] > 1 and hasattr(self, "_guildIDs"):
+            guildIDs |= self._guildIDs
+        self._guildIDs = guildIDs
+        if not hasattr(self, "http"):
+            self.http = rest.Http(self.user.id, self.token)
+
+    # Keeping `http`'s caches fresh. These are passive, so they don't ask for
+    #  intents of their own - they only see the events something else asked
+    #  for, and otherwise the caches' TTLs cover it. They're raw, since all
+    #  they need is an ID or two, and update events can be partial.
+
+    def _forget(self, typ: type[api.IDable], *oIDs: str):
+        if not hasattr(self, "http"): return
+        for oID in oIDs:
+            self.http.forget(typ, api.Snowflake(oID))
+
+    @Handle(enums.tcode.GuildUpdate, -100, passive=True, raw=True)
+    async def _forgetUpdatedGuild(self, payload: api.Payload):
+        self._forget(api.Guild, payload.d["id"])
+    @Handle(enums.tcode.GuildDelete, -100, passive=True, raw=True)
+    async def _forgetDeletedGuild(self, payload: api.Payload):
+        self._forget(api.Guild, payload.d["id"])
+    @Handle(enums.tcode.GuildRoleCreate, -100, passive=True, raw=True)
+    async def _forgetGuildOfCreatedRole(self, payload: api.Payload):
+        self._forget(api.Guild, payload.d["guild_id"])
+    @Handle(enums.tcode.GuildRoleUpdate, -100, passive=True, raw=True)
+    async def _forgetGuildOfUpdatedRole(self, payload: api.Payload):
+        self._forget(api.Guild, payload.d["guild_id"])
+    @Handle(enums.tcode.GuildRoleDelete, -100, passive=True, raw=True)
+    async def _forgetGuildOfDeletedRole(self, payload: api.Payload):
+        self._forget(api.Guild, payload.d["guild_id"])
+    @Handle(enums.tcode.GuildEmojisUpdate, -100, passive=True, raw=True)
+    async def _forgetGuildOfEmojis(self, payload: api.Payload):
+        self._forget(api.Guild, payload.d["guild_id"])
+
+    @Handle(enums.tcode.ChannelUpdate, -100, passive=True, raw=True)
+    async def _forgetUpdatedChannel(self, payload: api.Payload):
+        self._forget(api.Channel, payload.d["id"])
+    @Handle(enums.tcode.ChannelDelete, -100, passive=True, raw=True)
+    async def _forgetDeletedChannel(self, payload: api.Payload):
+        self._forget(api.Channel, payload.d["id"])
+    @Handle(enums.tcode.ThreadUpdate, -100, passive=True, raw=True)
+    async def _forgetUpdatedThread(self, payload: api.Payload):
+        self._forget(api.Channel, payload.d["id"])
+    @Handle(enums.tcode.ThreadDelete, -100, passive=True, raw=True)
+    async def _forgetDeletedThread(self, payload: api.Payload):
+        self._forget(api.Channel, payload.d["id"])
+
+    @Handle(enums.tcode.MessageUpdate, -100, passive=True, raw=True)
+    async def _forgetUpdatedMessage(self, payload: api.Payload):
+        self._forget(api.Message, payload.d["id"])
+    @Handle(enums.tcode.MessageDelete, -100, passive=True, raw=True)
+    async def _forgetDeletedMessage(self, payload: api.Payload):
+        self._forget(api.Message, payload.d["id"])
+    @Handle(enums.tcode.MessageDeleteBulk, -100, passive=True, raw=True)
+    async def _forgetDeletedMessages(self, payload: api.Payload):
+        self._forget(api.Message, *payload.d["ids"])
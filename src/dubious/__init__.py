@@ -5,4 +5,6 @@ from dubious.Machines import Handle, Machine, Command, Option, Choice
 from dubious.Pory import Chip, Pory
 from dubious.Pory2 import Pory2
 from dubious.Pory_Z import Pory_Z
+from dubious.Cluster import Cluster
+from dubious.Dispatch import Dispatcher, ConcurrentDispatcher, PartitionedDispatcher
 from dubious.GuildStructure import Structure, ModStructure, One, Many
@@ -5,7 +5,7 @@ import datetime as dt
 from typing import Any, Tuple
 
 from dubious.discord.enums import InteractionEventTypes, opcode, tcode
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr, StrictBool
 
 
 class Snowflake(str):
@@ -146,9 +146,16 @@ def t(t: tcode):
         return cls
     return register
 
-t_APIData = dict | bool | Disc | None
+# StrictBool keeps sequence numbers like 1 from being read as True.
+t_APIData = dict | StrictBool | int | Disc | None
 
 def castInner(p: Payload):
+    """ Casts the inner data of a `Payload` to the model for its code. The
+        result is kept on the `Payload`, so every handler of the same payload
+        gets the same object back without it being parsed again. """
+
+    if p._cast: return p._inner
+
     data: t_APIData
     if p.op in _Cast_op:
         data = _Cast_op[p.op].parse_obj(p.d)
@@ -156,6 +163,8 @@ def castInner(p: Payload):
         data = _Cast_t[p.t].parse_obj(p.d)
     else:
         data = p.d if hasattr(p, "d") else {}
+    p._inner = data
+    p._cast = True
     return data
 
 class IDable(Disc):
@@ -167,6 +176,15 @@ class Payload(Disc):
     s: int | None
     d: t_APIData
 
+    # The ID of the shard that recieved this payload.
+    _shard: int = PrivateAttr(0)
+    # The result of `castInner`, once it's been called.
+    _inner: t_APIData = PrivateAttr(None)
+    _cast: bool = PrivateAttr(False)
+
+    @property
+    def shard(self): return self._shard
+
     def __init__(self, **data: Any) -> None:
         super().__init__(**data)
         # We want to assign explicitly the data to d if it's a Disc,
@@ -174,6 +192,22 @@ class Payload(Disc):
         if isinstance(data["d"], Disc):
             self.d = data["d"]
 
+    @classmethod
+    def lazy(cls, raw: dict):
+        """ Creates a `Payload` from a decoded message without validating it.
+            Only `op`, `t` and `s` are looked at - `d` is kept as the raw data
+            until `castInner` is called on the `Payload`. """
+
+        t = raw.get("t")
+        return cls.construct(
+            op=opcode(raw["op"]),
+            t=_tcodes.get(t, t) if t else None,
+            s=raw.get("s"),
+            d=raw.get("d"),
+        )
+
+_tcodes: dict[str, tcode] = {code.value: code for code in tcode}
+
 # https://discord.com/developers/docs/topics/gateway#activity-object-activity-structure
 class Activity(Disc):
     # guaranteed
@@ -485,6 +519,12 @@ class Emoji(Disc):
     animated:       bool       | None
     available:      bool       | None
 
+# https://discord.com/developers/docs/topics/gateway#get-gateway-bot-json-response
+class GatewayBot(Disc):
+    url:                 str
+    shards:              int
+    session_start_limit: SessionStartLimit
+
 # https://discord.com/developers/docs/resources/guild#guild-object-guild-structure
 @t(tcode.GuildCreate)
 @t(tcode.GuildUpdate)
@@ -835,6 +875,15 @@ class MessageDelete(IDable):
     # not guaranteed
     guild_id: Snowflake | None
 
+# https://discord.com/developers/docs/topics/gateway#message-delete-bulk
+@t(tcode.MessageDeleteBulk)
+class MessageDeleteBulk(Disc):
+    # guaranteed
+    ids:        list[Snowflake]
+    channel_id: Snowflake
+    # not guaranteed
+    guild_id: Snowflake | None
+
 # https://discord.com/developers/docs/interactions/receiving-and-responding#message-interaction-object-message-interaction-structure
 class MessageInteraction(Disc):
     id:   Snowflake
@@ -904,6 +953,9 @@ class Ready(Disc):
     session_id:    str
     application:   PartialApplication
 
+    resume_gateway_url: str | None
+    shard:         list[int] | None
+
 # https://discord.com/developers/docs/topics/permissions#role-object-role-structure
 class Role(IDable):
     id:          Snowflake
@@ -928,6 +980,13 @@ class RoleTags(Disc):
     integration_id:     Snowflake | None
     premium_subscriber: bool      | None
 
+# https://discord.com/developers/docs/topics/gateway#session-start-limit-object-session-start-limit-structure
+class SessionStartLimit(Disc):
+    total:           int
+    remaining:       int
+    reset_after:     int
+    max_concurrency: int
+
 # https://discord.com/developers/docs/interactions/message-components#select-menu-object-select-option-structure
 class SelectOption(Disc):
     # guaranteed
@@ -0,0 +1,65 @@
+""" The JSON codec shared by the gateway connection and the REST client.
+
+    The fastest library that's installed is picked on import, in the order
+    orjson, ujson, json. A specific one can be picked with the `DUBIOUS_JSON`
+    environment variable, or at runtime with `use`.
+
+    `loads` accepts `str` or `bytes`, and `dumps` always returns `bytes`. """
+
+import importlib.util
+import json
+import os
+from typing import Any, Callable
+
+from pydantic.json import pydantic_encoder
+
+PREFERENCE = ("orjson", "ujson", "json")
+
+class CodecError(ImportError):
+    """ The requested JSON library isn't available. """
+
+def _orjson():
+    import orjson
+    return orjson.loads, lambda obj: orjson.dumps(obj, default=pydantic_encoder)
+
+def _ujson():
+    import ujson
+    return ujson.loads, lambda obj: ujson.dumps(obj, ensure_ascii=False, default=pydantic_encoder).encode()
+
+def _json():
+    return json.loads, lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=pydantic_encoder).encode()
+
+_makers: dict[str, Callable[[], tuple[Callable[[str | bytes], Any], Callable[[Any], bytes]]]] = {
+    "orjson": _orjson,
+    "ujson": _ujson,
+    "json": _json,
+}
+
+name: str
+loads: Callable[[str | bytes], Any]
+dumps: Callable[[Any], bytes]
+
+def available():
+    """ Gets the names of the JSON libraries that can be imported. """
+
+    return [n for n in PREFERENCE if n == "json" or importlib.util.find_spec(n)]
+
+def get(which: str):
+    """ Gets the `(loads, dumps)` pair for a JSON library by name. """
+
+    if not which in _makers:
+        raise CodecError(f"Unknown JSON library `{which}`. Choose from {PREFERENCE}.")
+    try:
+        return _makers[which]()
+    except ImportError as e:
+        raise CodecError(f"JSON library `{which}` isn't installed.") from e
+
+def use(which: str | None=None):
+    """ Sets the JSON library used by `loads` and `dumps`. If no name is given,
+        the fastest available library is used. """
+
+    global name, loads, dumps
+    name = which if which else available()[0]
+    loads, dumps = get(name)
+
+use(os.environ.get("DUBIOUS_JSON"))
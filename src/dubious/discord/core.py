@@ -1,34 +1,42 @@
 
 import abc
 import asyncio
+import json
+import random
 import sys
+import time
 import traceback
-from typing import (Any, ClassVar, Coroutine, Literal, TypeVar)
-
-from dubious.discord import api, enums, make
+import zlib
+from collections import deque
+from typing import Any, ClassVar, Coroutine, Literal
+
+from dubious.discord import api, codec, enums, etf, make
+from dubious.discord.identify import IdentifyScheduler
+from dubious.discord.queues import RecvQueue, SendScheduler
+from dubious.discord.recording import Recorder
 from websockets import client
+from websockets.exceptions import ConnectionClosed
+
+class Restart(Exception):
+    """ Raised inside a loop to have `Core.start` restart the loops. """
 
 class Core:
-    """ Framework class for classes that handle asynchronous loops. """
+    """ Framework class for classes that handle asynchronous loops.
+
+        The loops await their queues and sockets directly. Stopping them is
+        done by cancelling the future that gathers them, via `.stop`. """
 
     doDebug: ClassVar = True
 
+    # The gathered loops of the current run.
+    _fut: "asyncio.Future[Any] | None" = None
+
     def debug(self, *message):
         """ Prints to the console debugging messages if `.doDebug` is True. """
 
         if self.doDebug:
             print(*message)
 
-    t_CoroRet = TypeVar("t_CoroRet")
-    async def runWithTimeout(self,
-        coro: Coroutine[Any, Any, t_CoroRet]
-    ) -> t_CoroRet | Literal[False]:
-
-        try:
-            return await asyncio.wait_for(coro, 1)
-        except asyncio.TimeoutError:
-            return False
-
     @abc.abstractmethod
     def getcoros(self) -> Coroutine[Any, Any, Any]:
         """ Gets each async function to run on start. """
@@ -49,69 +57,156 @@ class Core:
     async def close(self):
         """ Runs cleanup for the loops (when stopping / an error occurs). """
 
+    def stop(self):
+        """ Stops all loops in `self.getcoros()` right away, without
+            restarting them. """
+
+        self.clear()
+        if self._fut:
+            self._fut.cancel()
+
     def start(self):
         """ Starts all loops in `self.getcoros()`. """
 
         self.set()
         loop = asyncio.get_event_loop()
         while self.isRunning():
-            fut = asyncio.gather(
+            self._fut = asyncio.gather(
                 *self.getcoros()
             )
 
             try:
-                loop.run_until_complete(fut)
+                loop.run_until_complete(self._fut)
             except KeyboardInterrupt:
                 self.debug("ctrl+c, canceling")
                 self.clear()
+            except asyncio.CancelledError:
+                pass
+            except Restart as e:
+                self.debug(f"restarting: {e}")
             except Exception as e:
                 self.debug(*traceback.format_exception(e))
             finally:
-                fut.cancel()
+                self._fut.cancel()
+                # The loops' own exception was already handled above.
                 fut = asyncio.gather(
-                    fut, self.close()
+                    self._fut, self.close(),
+                    return_exceptions=True
                 )
                 try:
                     loop.run_until_complete(fut)
                 except asyncio.CancelledError:
                     pass
+                self._fut = None
+
+# Every complete message in a zlib-stream connection ends with a Z_SYNC_FLUSH.
+ZLIB_SUFFIX = b"\x00\x00\xff\xff"
+
+# Close codes after which the session can't be resumed.
+#  https://discord.com/developers/docs/topics/opcodes-and-status-codes#gateway-gateway-close-event-codes
+NO_RESUME_CODES = {4007, 4009}
 
 class Discore(Core):
     """ Contains the functionality necessary to keep a gateway client
         connection alive. """
 
+    version: ClassVar = 9
+
     token: str
     intents: int
-    _sq: asyncio.Queue[api.Payload]
-    _rq: asyncio.Queue[api.Payload]
+    # (shard_id, num_shards)
+    shard: tuple[int, int]
+    encoding: Literal["json", "etf"]
+    compress: bool
+    _sq: SendScheduler
+    _rq: RecvQueue
+
+    running: asyncio.Event
 
     # Defined after connection
     uri: str
     _ws: client.WebSocketClientProtocol
     connected: asyncio.Event
+    # Set once Discord has sent Ready or Resumed on the current connection
+    ready: asyncio.Event
+    # One inflate context per connection when `.compress` is set
+    _inflator: "zlib._Decompress"
+    _buffer: bytearray
 
     # Defined after Hello payload
     _acked: asyncio.Event
     _heartrate: int
     _beating: asyncio.Event
+    # When the heartbeat waiting to be acknowledged was sent, if there is one
+    _beatSent: float | None
+    # Set when an Identify should be sent once the scheduler allows it
+    _identifyNeeded: asyncio.Event
+    # Seconds to wait before the next Identify, after an InvalidSession
+    _identifyDelay: float
+    # Seconds between each recent heartbeat and its acknowledgement
+    _latencies: deque[float]
+    # How many times the connection was found to be a zombie and restarted
+    zombies: int
+    # Whether the reader is waiting for room in a full recv queue, and when
+    #  it last stopped waiting. ACKs go unread while it waits.
+    _stalled: bool
+    _unstalledAt: float
+
+    # Defined after Ready payload, and kept between connections for resuming
+    sessionID: str | None
+    resumeUri: str | None
     _last: int | None
+    # Where the above gets saved to on close, if anywhere
+    sessionPath: str | None
+    # Spaces out the Identify payloads of every shard in the process
+    identifier: IdentifyScheduler
+    # Writes every frame recieved to a recording, if set
+    recorder: Recorder | None
 
     def __init__(self,
         token: str,
         intents: int,
-        uri: str="wss://gateway.discord.gg/?v=9&encoding=json"
+        uri: str="wss://gateway.discord.gg",
+        compress: bool=False,
+        encoding: Literal["json", "etf"]="json",
+        sessionPath: str | None=None,
+        shard: tuple[int, int]=(0, 1),
+        rq: RecvQueue | None=None,
+        latencyWindow: int=20,
+        identifier: IdentifyScheduler | None=None,
+        recorder: Recorder | None=None
     ):
         self.token = token
         self.intents = intents
+        self.shard = shard
         self.uri = uri
+        self.compress = compress
+        self.encoding = encoding
 
-        self._sq = asyncio.Queue()
-        self._rq = asyncio.Queue()
+        self._sq = SendScheduler()
+        self.identifier = identifier if identifier else IdentifyScheduler.shared
+        self.recorder = recorder
+        # Shards share one recv queue, which their `ShardManager` passes in.
+        self._rq = rq if rq else RecvQueue()
 
+        self.running = asyncio.Event()
         self.connected = asyncio.Event()
+        self.ready = asyncio.Event()
         self._acked = asyncio.Event()
         self._beating = asyncio.Event()
+        self._identifyNeeded = asyncio.Event()
+        self._identifyDelay = 0
+        self._beatSent = None
+        self._latencies = deque(maxlen=latencyWindow)
+        self.zombies = 0
+        self._stalled = False
+        self._unstalledAt = 0
+
+        self.sessionID = None
+        self.resumeUri = None
         self._last = None
+        self.sessionPath = sessionPath
+        self._loadSession()
 
     def getcoros(self):
         return (
@@ -119,23 +214,125 @@ class Discore(Core):
             self._task_recv(),
             self._task_send(),
             self._task_beat(),
+            self._task_identify(),
         )
 
     def set(self):
-        self.connected.set()
+        self.running.set()
 
     def isRunning(self):
-        return self.connected.is_set()
+        return self.running.is_set()
 
     def clear(self):
-        self._beating.clear()
-        self.connected.clear()
+        self.running.clear()
+
+    @property
+    def latency(self):
+        """ Seconds between the last heartbeat and its acknowledgement. """
+
+        return self._latencies[-1] if self._latencies else None
+
+    @property
+    def averageLatency(self):
+        """ The average heartbeat latency over the recent window. """
+
+        return sum(self._latencies) / len(self._latencies) if self._latencies else None
+
+    @property
+    def latencyWindow(self):
+        """ The heartbeat latencies in the recent window, oldest first. """
+
+        return list(self._latencies)
+
+    @property
+    def recvQueue(self):
+        """ The `RecvQueue` holding payloads waiting to be handled. """
+
+        return self._rq
+
+    @property
+    def scheduler(self):
+        """ The `SendScheduler` holding commands waiting to be sent. """
+
+        return self._sq
+
+    @property
+    def status(self):
+        """ Gets a short description of the state of the connection. """
+
+        if self.ready.is_set(): return "ready"
+        if self.connected.is_set(): return "connected"
+        if self.isRunning(): return "connecting"
+        return "stopped"
+
+    def shardStatus(self):
+        """ Gets the `.status` by shard ID, in the same shape as
+            `ShardManager.shardStatus`. """
+
+        return {self.shard[0]: self.status}
 
     async def close(self):
-        await self._ws.close()
+        self._beating.clear()
+        self._identifyNeeded.clear()
+        self.ready.clear()
+        self._sq.clearPriority()
+        self._sq.hold()
+        if self.connected.is_set():
+            self.connected.clear()
+            # Closing with 1000 invalidates the session on Discord's end, so
+            #  only do that when nothing is going to resume it.
+            resumable = self.sessionID and (self.isRunning() or self.sessionPath)
+            await self._ws.close(4000 if resumable else 1000)
+        self._saveSession()
+
+    def _loadSession(self):
+        """ Loads the resume state saved at `.sessionPath`, if any. """
+
+        if not self.sessionPath: return
+        try:
+            with open(self.sessionPath, "r") as f:
+                j = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+
+        self.sessionID = j.get("session_id")
+        self.resumeUri = j.get("resume_gateway_url")
+        self._last = j.get("seq")
+
+    def _saveSession(self):
+        """ Saves the resume state to `.sessionPath`, if set. """
+
+        if not self.sessionPath: return
+        with open(self.sessionPath, "w") as f:
+            json.dump({
+                "session_id": self.sessionID,
+                "resume_gateway_url": self.resumeUri,
+                "seq": self._last
+            }, f)
+
+    def _forgetSession(self):
+        """ Drops the resume state so that the next Hello identifies. """
+
+        self.sessionID = None
+        self.resumeUri = None
+        self._last = None
+
+    @property
+    def url(self):
+        """ The full gateway url to connect to, including the query string.
+            Uses the resume url Discord gave in the Ready payload if there's a
+            session to resume. """
+
+        uri = self.resumeUri if self.sessionID and self.resumeUri else self.uri
+        query = f"?v={self.version}&encoding={self.encoding}"
+        if self.compress:
+            query += "&compress=zlib-stream"
+        return f"{uri}/{query}"
 
     async def _task_conn(self):
-        self._ws = await client.connect(self.uri)
+        self._inflator = zlib.decompressobj()
+        self._buffer = bytearray()
+        self._ws = await client.connect(self.url)
         self.connected.set()
         #self.debug("Connected")
 
@@ -148,13 +345,23 @@ class Discore(Core):
         await self.connected.wait()
 
         while self.connected.is_set():
-            data = await self.runWithTimeout(self._ws.recv())
-            if data is None or data is False: continue
-
-            payload = api.Payload.parse_raw(data)
+            try:
+                data = await self._ws.recv()
+            except ConnectionClosed as e:
+                if e.rcvd and e.rcvd.code in NO_RESUME_CODES:
+                    self._forgetSession()
+                raise
+            if self.compress:
+                data = self._inflate(data)
+                if data is None: continue
+
+            if self.recorder:
+                self.recorder.write(data, self.shard[0], self.encoding)
+            payload = self._decode(data)
+            payload._shard = self.shard[0]
             #self.debug(f"[R] {payload}")
             if payload.s:
-                self.last = payload.s
+                self._last = payload.s
 
             match payload.op:
                 case enums.opcode.Hello:
@@ -162,11 +369,72 @@ class Discore(Core):
                     self._heartrate = cast.heartbeat_interval
                     self._beating.set()
                     self._acked.set()
-                    await self.send(self._identify())
+                    if self.sessionID:
+                        await self.send(self._resume())
+                    else:
+                        self._identifyNeeded.set()
                 case enums.opcode.HeartbeatAck:
+                    if self._beatSent is not None:
+                        self._latencies.append(time.perf_counter() - self._beatSent)
+                        self._beatSent = None
                     self._acked.set()
+                case enums.opcode.Heartbeat:
+                    # Discord can ask for a heartbeat right away.
+                    await self._beat()
+                case enums.opcode.Reconnect:
+                    raise Restart("Discord asked for a reconnect")
+                case enums.opcode.InvalidSession:
+                    if payload.d: raise Restart("session was invalidated, but can be resumed")
+                    self._forgetSession()
+                    self._identifyDelay = random.uniform(1, 5)
+                    self._identifyNeeded.set()
                 case _:
-                    await self._rq.put(payload)
+                    if payload.t == enums.tcode.Ready and isinstance(payload.d, dict):
+                        self.sessionID = payload.d["session_id"]
+                        self.resumeUri = payload.d.get("resume_gateway_url")
+                    if payload.t in (enums.tcode.Ready, enums.tcode.Resumed):
+                        self.ready.set()
+                        self._sq.release()
+                    if not self._rq.full():
+                        await self._rq.put(payload)
+                        continue
+                    self._stalled = True
+                    try:
+                        await self._rq.put(payload)
+                    finally:
+                        self._stalled = False
+                        self._unstalledAt = time.perf_counter()
+
+    def _inflate(self, data: str | bytes):
+        """ Buffers a compressed frame. Returns the inflated message as bytes
+            once the buffered frames end with `ZLIB_SUFFIX`, otherwise returns
+            None. """
+
+        self._buffer.extend(data.encode() if isinstance(data, str) else data)
+        if len(self._buffer) < 4 or self._buffer[-4:] != ZLIB_SUFFIX:
+            return None
+
+        data = self._inflator.decompress(self._buffer)
+        self._buffer.clear()
+        return data
+
+    def _decode(self, data: str | bytes):
+        """ Parses a complete message from Discord according to `.encoding`.
+
+            Only the envelope of the message is read here - the inner data is
+            left raw until a handler casts it with `api.castInner`. """
+
+        if self.encoding == "etf":
+            return api.Payload.lazy(etf.loads(data))
+        return api.Payload.lazy(codec.loads(data))
+
+    def _encode(self, payload: api.Payload):
+        """ Serializes a `Payload` according to `.encoding`. """
+
+        if self.encoding == "etf":
+            return etf.dumps(payload.dict())
+        # JSON has to go out as a text frame.
+        return codec.dumps(payload.dict()).decode()
 
     async def _task_send(self):
         """ Loop for sending data to the websocket. 
@@ -176,33 +444,70 @@ class Discore(Core):
         await self.connected.wait()
 
         while self.connected.is_set():
-            payload = await self.runWithTimeout(self._sq.get())
-            if payload is False: continue
+            payload = await self._sq.get()
             #self.debug(f"[S] {payload.json()}")
-            await self._ws.send(payload.json())
+            await self._ws.send(self._encode(payload))
 
     async def _task_beat(self):
         """ Loop for periodically adding an `opcode.Heartbeat` payload to the
-            send queue. """
+            send queue.
+
+            If a heartbeat isn't acknowledged by the time the next one is due,
+            the connection is a zombie, and gets restarted (and resumed) -
+            unless the reader was held up by a full recv queue in the meantime,
+            in which case the ACK may just not have been read yet. """
 
         await self.connected.wait()
+        await self._beating.wait()
+
+        # Discord asks for the first heartbeat to be jittered, so that bots
+        #  restarting at once don't all beat in step.
+        await asyncio.sleep(self._heartrate / 1000 * random.random())
 
         while self.connected.is_set():
-            res = await self.runWithTimeout(self._beating.wait())
-            if res is False: continue
+            await self._beat()
 
-            await self._acked.wait()
+            beatSent = self._beatSent
             await asyncio.sleep(self._heartrate / 1000)
+            if self._acked.is_set(): continue
+            if self._stalled or (beatSent is not None and self._unstalledAt > beatSent): continue
+            self.zombies += 1
+            raise Restart("heartbeat wasn't acknowledged, the connection is a zombie")
+
+    async def _beat(self):
+        """ Sends a heartbeat, and starts waiting for it to be acknowledged. """
 
-            self._acked.clear()
-            await self.send(self._heartbeat())
+        self._acked.clear()
+        self._beatSent = time.perf_counter()
+        await self.send(self._heartbeat())
+
+    async def _task_identify(self):
+        """ Loop for sending an `opcode.Identify` payload whenever the
+            connection needs one, once the `.identifier` allows it.
+
+            Waiting happens here rather than in `._task_recv` so that heartbeat
+            acknowledgements keep being read in the meantime - including the
+            1-5 seconds Discord asks for before identifying again after an
+            `opcode.InvalidSession`. """
+
+        await self.connected.wait()
+
+        while self.connected.is_set():
+            await self._identifyNeeded.wait()
+            self._identifyNeeded.clear()
+            if self._identifyDelay:
+                await asyncio.sleep(self._identifyDelay)
+                self._identifyDelay = 0
+            await self.identifier.acquire(self.shard[0])
+            await self.send(self._identify())
 
     def _heartbeat(self):
         """ Creates an `opcode.Heartbeat` payload based on the last sequence
             number sent by Discord. """
 
         return self.makePayload(
-            enums.opcode.Heartbeat
+            enums.opcode.Heartbeat,
+            self._last
         )
 
     def _identify(self):
@@ -215,6 +520,7 @@ class Discore(Core):
             make.Identify(
                 token=self.token,
                 intents=self.intents,
+                shard=list(self.shard),
                 properties={
                     "$os": sys.platform,
                     "$browser": "dubiousdiscord",
@@ -223,6 +529,21 @@ class Discore(Core):
             )
         )
 
+    def _resume(self):
+        """ Creates an `opcode.Resume` payload to send to Discord upon
+            recieving the `opcode.Hello` payload when there's a session to pick
+            back up. Replays everything missed since the last sequence number. """
+
+        if not self.sessionID: raise ValueError("There's no session to resume.")
+        return self.makePayload(
+            enums.opcode.Resume,
+            make.Resume(
+                token=self.token,
+                session_id=self.sessionID,
+                seq=self._last
+            )
+        )
+
     def makePayload(self, code: enums.codes, d: api.t_APIData=None):
         """ Creates a `Payload` that includes the last sequence number sent by
             Discord. """
@@ -242,6 +563,9 @@ class Discore(Core):
         return await self._rq.get()
 
     async def send(self, payload: api.Payload):
-        """ Puts a `Payload` into the send queue. """
+        """ Puts a `Payload` into the send queue. Payloads are sent in order
+            of priority, no faster than Discord's gateway rate limit. Commands
+            other than Heartbeat, Identify and Resume wait until the
+            connection is `.ready`. """
 
-        await self._sq.put(payload)
+        self._sq.put(payload)
@@ -58,7 +58,7 @@ class tcode(str, Enum):
     InviteCreate =               "INVITE_CREATE"
     InviteDelete =               "INVITE_DELETE"
     MessageCreate =              "MESSAGE_CREATE"
-    MessageUpdate =              "MESSAGE_EDIT"
+    MessageUpdate =              "MESSAGE_UPDATE"
     MessageDelete =              "MESSAGE_DELETE"
     MessageDeleteBulk =          "MESSAGE_DELETE_BULK"
     MessageReactionAdd =         "MESSAGE_REACTION_ADD"
@@ -167,6 +167,10 @@ class InteractionResponseTypes(int, Enum):
     Autocomplete   = 8
     Modal          = 9
 
+class MessageFlags(int, Enum):
+    """ https://discord.com/developers/docs/resources/channel#message-object-message-flags """
+    Ephemeral = 1 << 6
+
 class IdentifyPermissions(int, Enum):
     CreateInstantInvite =     1 << 0
     KickMembers =             1 << 1
@@ -0,0 +1,245 @@
+""" A codec for Erlang's External Term Format, as used by the gateway's
+    `encoding=etf` mode.
+
+    Decoding produces the same plain `dict`s that the json module does, so that
+    `api.Payload` and `api.castInner` don't need to know which encoding the
+    connection used: binaries and atoms become `str`, the atoms `nil`, `true`
+    and `false` become None, True and False, and bignums (which is how Discord
+    sends snowflakes) become `int`s.
+
+    `loads` uses erlpack's decoder if it's installed, and the pure-Python one
+    here (`pyLoads`) otherwise. Neither makes ETF a win over JSON: both decode
+    several times slower than the json module (erlpack's decoder is compiled
+    Cython, and measures about the same as `pyLoads`), and ETF frames are no
+    smaller than JSON once zlib-stream compressed - see `benchmarks/etf.py`.
+    JSON is the better choice unless ETF is needed for its own sake. """
+
+import struct
+import zlib
+from typing import Any
+
+try:
+    from erlpack import ErlangTermDecoder
+except ImportError:
+    ErlangTermDecoder = None
+
+VERSION = 131
+
+NEW_FLOAT = 70
+COMPRESSED = 80
+SMALL_INTEGER = 97
+INTEGER = 98
+FLOAT = 99
+ATOM = 100
+SMALL_TUPLE = 104
+LARGE_TUPLE = 105
+NIL = 106
+STRING = 107
+LIST = 108
+BINARY = 109
+SMALL_BIG = 110
+LARGE_BIG = 111
+SMALL_ATOM = 115
+MAP = 116
+ATOM_UTF8 = 118
+SMALL_ATOM_UTF8 = 119
+
+_atoms = {"nil": None, "true": True, "false": False}
+
+_u16 = struct.Struct(">H").unpack_from
+_u32 = struct.Struct(">I").unpack_from
+_i32 = struct.Struct(">i").unpack_from
+_f64 = struct.Struct(">d").unpack_from
+
+class ETFError(ValueError):
+    """ The data couldn't be decoded or encoded as External Term Format. """
+
+def _atom(name: str):
+    return _atoms.get(name, name)
+
+def _decode(data: bytes, i: int) -> tuple[Any, int]:
+    """ Decodes the term starting at index `i` of `data`. Returns the term and
+        the index right after it. """
+
+    tag = data[i]
+    i += 1
+
+    if tag == BINARY:
+        size, = _u32(data, i)
+        i += 4
+        return data[i:i+size].decode(), i + size
+
+    if tag == MAP:
+        arity, = _u32(data, i)
+        i += 4
+        m = {}
+        for _ in range(arity):
+            key, i = _decode(data, i)
+            m[key], i = _decode(data, i)
+        return m, i
+
+    if tag == SMALL_INTEGER:
+        return data[i], i + 1
+
+    if tag in (SMALL_ATOM_UTF8, SMALL_ATOM):
+        size = data[i]
+        i += 1
+        return _atom(data[i:i+size].decode("utf-8" if tag == SMALL_ATOM_UTF8 else "latin-1")), i + size
+
+    if tag in (ATOM_UTF8, ATOM):
+        size, = _u16(data, i)
+        i += 2
+        return _atom(data[i:i+size].decode("utf-8" if tag == ATOM_UTF8 else "latin-1")), i + size
+
+    if tag == LIST:
+        size, = _u32(data, i)
+        i += 4
+        ls = []
+        for _ in range(size):
+            item, i = _decode(data, i)
+            ls.append(item)
+        # Proper lists end with NIL; improper tails are dropped.
+        _, i = _decode(data, i)
+        return ls, i
+
+    if tag == NIL:
+        return [], i
+
+    if tag == INTEGER:
+        return _i32(data, i)[0], i + 4
+
+    if tag in (SMALL_BIG, LARGE_BIG):
+        if tag == SMALL_BIG:
+            size = data[i]
+            i += 1
+        else:
+            size, = _u32(data, i)
+            i += 4
+        sign = data[i]
+        i += 1
+        n = int.from_bytes(data[i:i+size], "little")
+        return -n if sign else n, i + size
+
+    if tag == NEW_FLOAT:
+        return _f64(data, i)[0], i + 8
+
+    if tag == FLOAT:
+        return float(data[i:i+31].split(b"\x00", 1)[0]), i + 31
+
+    if tag == STRING:
+        size, = _u16(data, i)
+        i += 2
+        return data[i:i+size].decode("latin-1"), i + size
+
+    if tag in (SMALL_TUPLE, LARGE_TUPLE):
+        if tag == SMALL_TUPLE:
+            arity = data[i]
+            i += 1
+        else:
+            arity, = _u32(data, i)
+            i += 4
+        items = []
+        for _ in range(arity):
+            item, i = _decode(data, i)
+            items.append(item)
+        return tuple(items), i
+
+    if tag == COMPRESSED:
+        size, = _u32(data, i)
+        inflated = zlib.decompress(data[i+4:])
+        if len(inflated) != size:
+            raise ETFError("Compressed term had the wrong uncompressed size.")
+        term, _ = _decode(inflated, 0)
+        return term, len(data)
+
+    raise ETFError(f"Unknown term tag {tag} at index {i - 1}.")
+
+def pyLoads(data: bytes | bytearray | memoryview) -> Any:
+    """ Decodes a complete External Term Format message in pure Python. """
+
+    data = bytes(data)
+    if not data or data[0] != VERSION:
+        raise ETFError("Data doesn't start with the External Term Format version byte.")
+    term, _ = _decode(data, 1)
+    return term
+
+if ErlangTermDecoder:
+    _fastLoads = ErlangTermDecoder(encoding="utf8").loads
+else:
+    _fastLoads = None
+
+# Whether `loads` uses erlpack
+accelerated = _fastLoads is not None
+
+def loads(data: bytes | bytearray | memoryview) -> Any:
+    """ Decodes a complete External Term Format message, with erlpack if
+        it's installed. """
+
+    if not _fastLoads:
+        return pyLoads(data)
+    try:
+        return _fastLoads(data if isinstance(data, (bytes, bytearray)) else bytes(data))
+    except Exception as e:
+        # erlpack raises a mix of its own errors and builtin ones.
+        raise ETFError(str(e)) from e
+
+_pack_f64 = struct.Struct(">Bd").pack
+_pack_i32 = struct.Struct(">Bi").pack
+_pack_u32 = struct.Struct(">BI").pack
+
+def _encodeAtom(name: str):
+    raw = name.encode()
+    return bytes((SMALL_ATOM_UTF8, len(raw))) + raw
+
+_NONE = _encodeAtom("nil")
+_TRUE = _encodeAtom("true")
+_FALSE = _encodeAtom("false")
+
+def _encode(term: Any, out: bytearray):
+    if term is None:
+        out += _NONE
+    elif term is True:
+        out += _TRUE
+    elif term is False:
+        out += _FALSE
+    elif isinstance(term, str):
+        raw = str.encode(term)
+        out += _pack_u32(BINARY, len(raw))
+        out += raw
+    elif isinstance(term, int):
+        if 0 <= term < 256:
+            out += bytes((SMALL_INTEGER, term))
+        elif -2**31 <= term < 2**31:
+            out += _pack_i32(INTEGER, term)
+        else:
+            raw = abs(term).to_bytes((abs(term).bit_length() + 7) // 8, "little")
+            if len(raw) > 255:
+                raise ETFError("Integer is too large to encode.")
+            out += bytes((SMALL_BIG, len(raw), term < 0))
+            out += raw
+    elif isinstance(term, float):
+        out += _pack_f64(NEW_FLOAT, term)
+    elif isinstance(term, dict):
+        out += _pack_u32(MAP, len(term))
+        for key, value in term.items():
+            _encode(key, out)
+            _encode(value, out)
+    elif isinstance(term, (list, tuple, set)):
+        if term:
+            out += _pack_u32(LIST, len(term))
+            for item in term:
+                _encode(item, out)
+        out.append(NIL)
+    elif isinstance(term, (bytes, bytearray)):
+        out += _pack_u32(BINARY, len(term))
+        out += term
+    else:
+        raise ETFError(f"Can't encode {type(term)} as External Term Format.")
+
+def dumps(term: Any) -> bytes:
+    """ Encodes a term (such as the result of `api.Payload.dict`) as a complete
+        External Term Format message. """
+
+    out = bytearray((VERSION,))
+    _encode(term, out)
+    return bytes(out)
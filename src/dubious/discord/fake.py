@@ -0,0 +1,381 @@
+""" A fake Discord gateway for load testing without a network.
+
+    `FakeGateway` is a websocket server that speaks enough of the gateway
+    protocol for a `Discore` to connect, identify, heartbeat, resume and get a
+    stream of synthetic events. Point a `Discore` (or `Chip.start`) at it with
+    `uri=gateway.uri`. """
+
+import asyncio
+import datetime as dt
+import itertools
+import threading
+import time
+import uuid
+import zlib
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+from dubious.discord import codec, enums, etf, intents
+from websockets import server
+from websockets.exceptions import ConnectionClosed
+
+def _snowflake(n: int):
+    # Arbitrary, but shaped like a real ID so that `>> 22` gives the shard.
+    return str((1_000_000_000 + n) << 22)
+
+class _Connection:
+    """ The server's view of one connected client. """
+
+    def __init__(self, ws: Any, encoding: str, compress: bool):
+        self.ws = ws
+        self.encoding = encoding
+        self.compressor = zlib.compressobj() if compress else None
+        self.seq = 0
+        self.shard = (0, 1)
+        self.intents = 0
+        self.sessionID: str | None = None
+        self.stream: asyncio.Task[None] | None = None
+
+class FakeGateway:
+    """ A websocket server that acts like Discord's gateway.
+
+        On connect it sends Hello. An Identify gets a Ready, then a
+        GUILD_CREATE for each of the `guilds` guilds that belong to the
+        connection's shard, each with `members` members. After that, each
+        connection gets `messageRate` MESSAGE_CREATEs per second, spread over
+        its guilds. Each message's `timestamp` is when it was sent, so the
+        time it took to reach a handler can be measured.
+
+        Like Discord, events that the connection's intents don't cover aren't
+        sent.
+
+        Like Discord, any other command sent before an Identify or Resume
+        closes the connection with 4003.
+
+        Heartbeats are acknowledged unless `ackHeartbeats` is False. A Resume
+        for a session the server knows gets Resumed, and anything else gets
+        an InvalidSession. `.reconnect` and `.invalidate` send Reconnect and
+        InvalidSession to every connection.
+
+        Both the JSON and ETF encodings work, with or without zlib-stream. """
+
+    host: str
+    port: int
+    guilds: int
+    members: int
+    messageRate: float
+    heartbeatInterval: int
+    ackHeartbeats: bool
+
+    # Seconds between each batch of messages
+    tick: float = 0.01
+
+    # Dispatches sent, across all connections
+    dispatched: int
+    identifies: int
+    resumes: int
+
+    def __init__(self,
+        host: str="localhost",
+        port: int=0,
+        guilds: int=10,
+        members: int=100,
+        messageRate: float=0,
+        heartbeatInterval: int=41250,
+        ackHeartbeats: bool=True
+    ):
+        self.host = host
+        self.port = port
+        self.guilds = guilds
+        self.members = members
+        self.messageRate = messageRate
+        self.heartbeatInterval = heartbeatInterval
+        self.ackHeartbeats = ackHeartbeats
+
+        self.dispatched = 0
+        self.identifies = 0
+        self.resumes = 0
+
+        self.connections: set[_Connection] = set()
+        # Known sessions and the shard and intents they were for
+        self._sessions: dict[str, tuple[tuple[int, int], int]] = {}
+        self._messageIDs = itertools.count(1)
+        self._server: Any = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def uri(self):
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self):
+        """ Starts listening. If `port` is 0, a free one is picked. """
+
+        self._loop = asyncio.get_running_loop()
+        self._server = await server.serve(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    def serveInThread(self):
+        """ Starts the server on its own event loop in a daemon thread, for
+            when the current thread is going to be blocked by `Chip.start`.
+            Returns once it's listening. Use `.call` to control it after. """
+
+        started = threading.Event()
+        def run():
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+        threading.Thread(target=run, name="dubious-fake-gateway", daemon=True).start()
+        started.wait()
+        return self
+
+    def call(self, coro: Any):
+        """ Runs a coroutine (e.g. `.reconnect()`) on the server's loop from
+            another thread. """
+
+        assert self._loop
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def guildIDs(self, shard: tuple[int, int]=(0, 1)):
+        """ Gets the IDs of the guilds that belong to a shard. """
+
+        ids = (_snowflake(n) for n in range(self.guilds))
+        return [gid for gid in ids if (int(gid) >> 22) % shard[1] == shard[0]]
+
+    # Synthetic data
+
+    def user(self, n: int):
+        return {
+            "id": _snowflake(10**6 + n),
+            "username": f"user{n}",
+            "discriminator": f"{n % 10000:04}",
+            "avatar": None,
+            "public_flags": 0,
+        }
+
+    def member(self, n: int):
+        return {
+            "user": self.user(n),
+            "roles": [],
+            "joined_at": "2021-05-01T12:34:56.789000+00:00",
+            "nick": None,
+            "deaf": False,
+            "mute": False,
+        }
+
+    def channel(self, guildID: str):
+        return {
+            "id": str(int(guildID) + 1),
+            "type": 0,
+            "guild_id": guildID,
+            "position": 0,
+            "permission_overwrites": [],
+            "name": "general",
+            "nsfw": False,
+            "rate_limit_per_user": 0,
+        }
+
+    def guild(self, guildID: str):
+        return {
+            "id": guildID,
+            "name": f"guild {guildID}",
+            "icon": None,
+            "splash": None,
+            "discovery_splash": None,
+            "owner_id": self.user(0)["id"],
+            "afk_channel_id": None,
+            "afk_timeout": 300,
+            "verification_level": 0,
+            "default_message_notifications": 0,
+            "explicit_content_filter": 0,
+            "roles": [{
+                "id": guildID,
+                "name": "@everyone",
+                "color": 0,
+                "hoist": False,
+                "position": 0,
+                "permissions": "1071698660929",
+                "managed": False,
+                "mentionable": False,
+            }],
+            "emojis": [],
+            "features": [],
+            "mfa_level": 0,
+            "application_id": None,
+            "system_channel_id": None,
+            "system_channel_flags": 0,
+            "rules_channel_id": None,
+            "vanity_url_code": None,
+            "description": None,
+            "banner": None,
+            "premium_tier": 0,
+            "preferred_locale": "en-US",
+            "public_updates_channel_id": None,
+            "nsfw_level": 0,
+            "joined_at": "2021-05-01T12:34:56.789000+00:00",
+            "large": self.members > 250,
+            "unavailable": False,
+            "member_count": self.members,
+            "members": [self.member(m) for m in range(self.members)],
+            "channels": [self.channel(guildID)],
+            "voice_states": [],
+            "presences": [],
+        }
+
+    def message(self, guildID: str):
+        n = next(self._messageIDs)
+        return {
+            "id": _snowflake(10**8 + n),
+            "channel_id": str(int(guildID) + 1),
+            "guild_id": guildID,
+            "author": self.user(n % max(self.members, 1)),
+            "content": f"message {n}",
+            "timestamp": dt.datetime.now(dt.timezone.utc).isoformat(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": [],
+            "pinned": False,
+            "type": 0,
+        }
+
+    # Protocol
+
+    async def _send(self, conn: _Connection, op: enums.opcode, d: Any=None, t: str | None=None):
+        s = None
+        if op == enums.opcode.Dispatch:
+            conn.seq += 1
+            s = conn.seq
+            self.dispatched += 1
+        payload = {"op": op.value, "d": d, "s": s, "t": t}
+
+        data: str | bytes
+        if conn.encoding == "etf":
+            data = etf.dumps(payload)
+        else:
+            data = codec.dumps(payload)
+        if conn.compressor:
+            data = conn.compressor.compress(data) + conn.compressor.flush(zlib.Z_SYNC_FLUSH)
+        elif conn.encoding == "json":
+            data = data.decode()
+        await conn.ws.send(data)
+
+    async def dispatch(self, conn: _Connection, t: enums.tcode | str, d: Any):
+        """ Sends a dispatch event to one connection, if its intents cover
+            the event. """
+
+        if not intents.reaches(t, conn.intents): return
+        await self._send(conn, enums.opcode.Dispatch, d, t.value if isinstance(t, enums.tcode) else t)
+
+    async def reconnect(self):
+        """ Asks every connection to reconnect and resume. """
+
+        for conn in list(self.connections):
+            await self._send(conn, enums.opcode.Reconnect)
+
+    async def invalidate(self, resumable: bool=False):
+        """ Invalidates every connection's session. """
+
+        for conn in list(self.connections):
+            if not resumable and conn.sessionID:
+                self._sessions.pop(conn.sessionID, None)
+            await self._send(conn, enums.opcode.InvalidSession, resumable)
+
+    async def _handle(self, ws: Any, path: str | None=None):
+        query = parse_qs(urlparse(path if path is not None else ws.path).query)
+        conn = _Connection(ws,
+            query.get("encoding", ["json"])[0],
+            query.get("compress", [""])[0] == "zlib-stream"
+        )
+        self.connections.add(conn)
+        try:
+            await self._send(conn, enums.opcode.Hello, {"heartbeat_interval": self.heartbeatInterval})
+            async for message in ws:
+                j = etf.loads(message) if conn.encoding == "etf" else codec.loads(message)
+                await self._command(conn, enums.opcode(j["op"]), j.get("d"))
+        except ConnectionClosed:
+            pass
+        finally:
+            self.connections.discard(conn)
+            if conn.stream: conn.stream.cancel()
+
+    async def _command(self, conn: _Connection, op: enums.opcode, d: Any):
+        match op:
+            case enums.opcode.Heartbeat:
+                if self.ackHeartbeats:
+                    await self._send(conn, enums.opcode.HeartbeatAck)
+            case enums.opcode.Identify:
+                self.identifies += 1
+                shardID, count = d.get("shard") or (0, 1)
+                conn.shard = (shardID, count)
+                conn.intents = d.get("intents", 0)
+                conn.sessionID = uuid.uuid4().hex
+                self._sessions[conn.sessionID] = (conn.shard, conn.intents)
+                await self._ready(conn)
+            case enums.opcode.Resume:
+                shard = self._sessions.get(d.get("session_id"))
+                if not shard:
+                    await self._send(conn, enums.opcode.InvalidSession, False)
+                    return
+                self.resumes += 1
+                conn.shard, conn.intents = shard
+                conn.sessionID = d["session_id"]
+                conn.seq = d.get("seq") or 0
+                await self.dispatch(conn, enums.tcode.Resumed, {})
+                self._startStream(conn)
+            case _:
+                if not conn.sessionID:
+                    await conn.ws.close(4003, "Not authenticated.")
+
+    async def _ready(self, conn: _Connection):
+        guildIDs = self.guildIDs(conn.shard)
+        bot = self.user(0)
+        bot["bot"] = True
+        await self.dispatch(conn, enums.tcode.Ready, {
+            "v": 9,
+            "user": bot,
+            "guilds": [{"id": gid, "unavailable": True} for gid in guildIDs],
+            "session_id": conn.sessionID,
+            "resume_gateway_url": self.uri,
+            "shard": list(conn.shard),
+            "application": {"id": bot["id"], "flags": 0},
+        })
+        for gid in guildIDs:
+            await self.dispatch(conn, enums.tcode.GuildCreate, self.guild(gid))
+        self._startStream(conn)
+
+    def _startStream(self, conn: _Connection):
+        if conn.stream: conn.stream.cancel()
+        guildIDs = self.guildIDs(conn.shard)
+        if self.messageRate and guildIDs:
+            conn.stream = asyncio.create_task(self._stream(conn, guildIDs))
+
+    async def _stream(self, conn: _Connection, guildIDs: list[str]):
+        """ Sends `messageRate` messages per second, in batches every `tick`
+            seconds, cycling through the connection's guilds. """
+
+        guilds = itertools.cycle(guildIDs)
+        start = time.perf_counter()
+        sent = 0
+        while True:
+            due = int((time.perf_counter() - start) * self.messageRate)
+            for _ in range(due - sent):
+                await self.dispatch(conn, enums.tcode.MessageCreate, self.message(next(guilds)))
+            sent = due
+            await asyncio.sleep(self.tick)
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import time
+from typing import ClassVar
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+class IdentifyScheduler:
+    """ Spaces out Identify payloads the way Discord allows: shards are put in
+        buckets by `shard_id % maxConcurrency`, and each bucket can identify
+        once every `interval` seconds. Buckets don't wait on each other.
+
+        One scheduler is shared by every `Discore` in the process (`.shared`).
+        If a `lockDir` is set, the buckets are also shared with other processes
+        that use the same directory, through a lock file per bucket. """
+
+    shared: ClassVar["IdentifyScheduler"]
+
+    interval: ClassVar = 5.0
+
+    maxConcurrency: int
+    lockDir: str | None
+
+    def __init__(self, maxConcurrency: int=1, lockDir: str | None=None):
+        self.maxConcurrency = maxConcurrency
+        self.lockDir = lockDir
+
+        self._locks: dict[int, asyncio.Lock] = {}
+        # When each bucket last identified, by `time.time`
+        self._last: dict[int, float] = {}
+
+    def bucket(self, shardID: int):
+        return shardID % self.maxConcurrency
+
+    async def acquire(self, shardID: int):
+        """ Waits until the shard is allowed to identify, and counts it as
+            having identified. """
+
+        bucket = self.bucket(shardID)
+        lock = self._locks.setdefault(bucket, asyncio.Lock())
+        async with lock:
+            if self.lockDir:
+                await asyncio.to_thread(self._acquireAcrossProcesses, bucket)
+            else:
+                wait = self._last.get(bucket, 0) + self.interval - time.time()
+                if wait > 0: await asyncio.sleep(wait)
+            self._last[bucket] = time.time()
+
+    def _acquireAcrossProcesses(self, bucket: int):
+        """ Blocks until the bucket's lock file is free and its last identify
+            (from any process) was long enough ago. """
+
+        if not fcntl: raise RuntimeError("Sharing identify buckets across processes needs fcntl.")
+        assert self.lockDir
+        os.makedirs(self.lockDir, exist_ok=True)
+        with open(os.path.join(self.lockDir, f"identify-{bucket}.lock"), "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                last = float(f.read() or 0)
+                wait = last + self.interval - time.time()
+                if wait > 0: time.sleep(wait)
+                f.seek(0)
+                f.truncate()
+                f.write(str(time.time()))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+IdentifyScheduler.shared = IdentifyScheduler()
@@ -0,0 +1,89 @@
+""" Which gateway intents each dispatch event needs.
+
+    https://discord.com/developers/docs/topics/gateway#list-of-intents """
+
+from typing import Iterable
+
+from dubious.discord.enums import Intents, tcode
+
+# Any one of the intents listed for an event is enough for Discord to send it.
+#  The first is the one picked when working out the fewest intents needed -
+#  the guild one, where there's a choice between guilds and DMs.
+#  Events that aren't listed are sent no matter the intents.
+REQUIRED: dict[tcode, tuple[Intents, ...]] = {
+    tcode.GuildCreate:                (Intents.Guilds,),
+    tcode.GuildUpdate:                (Intents.Guilds,),
+    tcode.GuildDelete:                (Intents.Guilds,),
+    tcode.GuildRoleCreate:            (Intents.Guilds,),
+    tcode.GuildRoleUpdate:            (Intents.Guilds,),
+    tcode.GuildRoleDelete:            (Intents.Guilds,),
+    tcode.ChannelCreate:              (Intents.Guilds,),
+    tcode.ChannelUpdate:              (Intents.Guilds,),
+    tcode.ChannelDelete:              (Intents.Guilds,),
+    tcode.ChannelPinsUpdate:          (Intents.Guilds, Intents.DirectMessages),
+    tcode.ThreadCreate:               (Intents.Guilds,),
+    tcode.ThreadUpdate:               (Intents.Guilds,),
+    tcode.ThreadDelete:               (Intents.Guilds,),
+    tcode.ThreadListSync:             (Intents.Guilds,),
+    tcode.ThreadMemberUpdate:         (Intents.Guilds,),
+    tcode.ThreadMembersUpdate:        (Intents.Guilds, Intents.GuildMembers),
+    tcode.StageInstanceCreate:        (Intents.Guilds,),
+    tcode.StageInstanceUpdate:        (Intents.Guilds,),
+    tcode.StageInstanceDelete:        (Intents.Guilds,),
+
+    tcode.GuildMemberAdd:             (Intents.GuildMembers,),
+    tcode.GuildMemberUpdate:          (Intents.GuildMembers,),
+    tcode.GuildMemberRemove:          (Intents.GuildMembers,),
+
+    tcode.GuildBanAdd:                (Intents.GuildBans,),
+    tcode.GuildBanRemove:             (Intents.GuildBans,),
+
+    tcode.GuildEmojisUpdate:          (Intents.GuildEmojisAndStickers,),
+    tcode.GuildStickersUpdate:        (Intents.GuildEmojisAndStickers,),
+
+    tcode.GuildIntegrationsUpdate:    (Intents.GuildIntegrations,),
+    tcode.GuildIntegrationCreate:     (Intents.GuildIntegrations,),
+    tcode.GuildIntegrationUpdate:     (Intents.GuildIntegrations,),
+    tcode.GuildIntegrationDelete:     (Intents.GuildIntegrations,),
+
+    tcode.WebhooksUpdate:             (Intents.GuildWebhooks,),
+
+    tcode.InviteCreate:               (Intents.GuildInvites,),
+    tcode.InviteDelete:               (Intents.GuildInvites,),
+
+    tcode.VoiceStateUpdate:           (Intents.GuildVoiceStates,),
+
+    tcode.PresenceUpdate:             (Intents.GuildPresences,),
+
+    tcode.MessageCreate:              (Intents.GuildMessages, Intents.DirectMessages),
+    tcode.MessageUpdate:              (Intents.GuildMessages, Intents.DirectMessages),
+    tcode.MessageDelete:              (Intents.GuildMessages, Intents.DirectMessages),
+    tcode.MessageDeleteBulk:          (Intents.GuildMessages,),
+
+    tcode.MessageReactionAdd:         (Intents.GuildMessageReactions, Intents.DirectMessageReactions),
+    tcode.MessageReactionRemove:      (Intents.GuildMessageReactions, Intents.DirectMessageReactions),
+    tcode.MessageReactionRemoveAll:   (Intents.GuildMessageReactions, Intents.DirectMessageReactions),
+    tcode.MessageReactionRemoveEmoji: (Intents.GuildMessageReactions, Intents.DirectMessageReactions),
+
+    tcode.TypingStart:                (Intents.GuildMessageTyping, Intents.DirectMessageTyping),
+}
+
+def forCodes(codes: Iterable[object]):
+    """ Gets the fewest intents that get Discord to send every event given. """
+
+    intents = 0
+    for code in codes:
+        if isinstance(code, tcode) and code in REQUIRED:
+            intents |= REQUIRED[code][0]
+    return intents
+
+def reaches(code: object, intents: int):
+    """ Gets whether Discord will send an event with the given intents. """
+
+    if not isinstance(code, tcode) or not code in REQUIRED: return True
+    return any(intents & intent for intent in REQUIRED[code])
+
+def describe(intents: int):
+    """ Gets the names of the intents in a bitmask. """
+
+    return [intent.name for intent in Intents if intents & intent]
@@ -20,11 +20,13 @@ class Identify(Make):
     token:      str
     intents:    int
     properties: dict
+    # [shard_id, num_shards]
+    shard:      list[int] = [0, 1]
 
 class Resume(Make):
-    token: str
-    session: str
-    seq: int | None
+    token:      str
+    session_id: str
+    seq:        int | None
 
 class CommandOptionChoice(Make):
     name: str
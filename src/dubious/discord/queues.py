@@ -0,0 +1,294 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from typing import BinaryIO, ClassVar, Literal
+
+from dubious.discord import api, codec, enums
+
+class SendScheduler:
+    """ Holds gateway commands waiting to be sent, and hands them out no faster
+        than Discord allows (`limit` commands every `per` seconds).
+
+        Commands that keep the connection alive - Heartbeat, Identify and
+        Resume - go ahead of everything else, and `reserved` slots in each
+        window are kept free for them so that a burst of other commands can't
+        hold back a heartbeat.
+
+        Everything else is held until `.release` is called, once the
+        connection is authenticated, since Discord closes a connection that
+        sends other commands before its Identify or Resume. `.hold` holds them
+        again for the next connection. """
+
+    # Lower goes first. Anything not listed goes last.
+    priorities: dict[enums.opcode, int] = {
+        enums.opcode.Heartbeat: 0,
+        enums.opcode.Identify: 1,
+        enums.opcode.Resume: 1,
+    }
+    lowest = 2
+
+    limit: int
+    per: float
+    reserved: int
+
+    # Seconds spent waiting for the limit to allow a send
+    throttled: float
+    sent: int
+
+    def __init__(self, limit: int=120, per: float=60, reserved: int=5):
+        self.limit = limit
+        self.per = per
+        self.reserved = reserved
+
+        self.throttled = 0
+        self.sent = 0
+
+        self._heap: list[tuple[int, int, api.Payload]] = []
+        self._order = itertools.count()
+        self._pushed = asyncio.Event()
+        self._held = True
+        # When each send in the current window happened
+        self._window: deque[float] = deque()
+
+    def qsize(self):
+        """ Gets the number of commands waiting to be sent. """
+
+        return len(self._heap)
+
+    def depths(self):
+        """ Gets the number of commands waiting to be sent by priority. """
+
+        depths: dict[int, int] = {}
+        for priority, _, _ in self._heap:
+            depths[priority] = depths.get(priority, 0) + 1
+        return depths
+
+    def put(self, payload: api.Payload):
+        """ Adds a command to be sent. """
+
+        priority = self.priorities.get(payload.op, self.lowest)
+        heapq.heappush(self._heap, (priority, next(self._order), payload))
+        self._pushed.set()
+
+    def clearPriority(self):
+        """ Drops queued Heartbeat, Identify and Resume commands, which only
+            mean anything on the connection they were made for. """
+
+        self._heap = [item for item in self._heap if item[0] == self.lowest]
+        heapq.heapify(self._heap)
+
+    def hold(self):
+        """ Holds back every command but Heartbeat, Identify and Resume. """
+
+        self._held = True
+
+    def release(self):
+        """ Lets held back commands be sent. """
+
+        self._held = False
+        self._pushed.set()
+
+    def _wait(self, priority: int, now: float):
+        """ Gets how long a command of the given priority has to wait before
+            it can be sent. """
+
+        while self._window and self._window[0] <= now - self.per:
+            self._window.popleft()
+        limit = self.limit if priority < self.lowest else self.limit - self.reserved
+        if len(self._window) < limit:
+            return 0
+        return self._window[len(self._window) - limit] + self.per - now
+
+    async def get(self):
+        """ Waits for the next command that's allowed to be sent, then takes it
+            out of the queue. """
+
+        while True:
+            if not self._heap:
+                self._pushed.clear()
+                await self._pushed.wait()
+                continue
+
+            now = time.monotonic()
+            priority, _, payload = self._heap[0]
+            if priority == self.lowest and self._held:
+                self._pushed.clear()
+                await self._pushed.wait()
+                continue
+            wait = self._wait(priority, now)
+            if wait <= 0:
+                heapq.heappop(self._heap)
+                self._window.append(now)
+                self.sent += 1
+                return payload
+
+            # Something more urgent might get put in while waiting.
+            self._pushed.clear()
+            try:
+                await asyncio.wait_for(self._pushed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+            self.throttled += time.monotonic() - now
+
+t_RecvPolicy = Literal["block", "shed", "spill"]
+
+class RecvQueue:
+    """ Holds payloads recieved from Discord until a `Chip` handles them. Holds
+        at most `maxsize` payloads in memory (or any number, if 0). When it's
+        full, what happens to the next payload depends on the `policy`:
+
+        - "block": the reader waits until there's room, which leaves further
+          messages unread on the socket.
+        - "shed": the oldest `lowPriority` payload is dropped to make room,
+          or the new one is if it's low priority itself. If there's nothing
+          low priority to drop, the reader waits as with "block".
+        - "spill": the payload is written to the file at `spillPath`, and read
+          back once the payloads before it have been handled.
+
+        Payloads always come out in the order they were put in. """
+
+    # Events that are safe to drop when handlers can't keep up.
+    lowPriority: ClassVar[frozenset[enums.tcode]] = frozenset({
+        enums.tcode.TypingStart,
+        enums.tcode.PresenceUpdate,
+    })
+
+    maxsize: int
+    policy: t_RecvPolicy
+    spillPath: str | None
+
+    # Dropped payloads, by event name
+    shed: dict[str, int]
+    spilled: int
+    # Seconds the reader spent waiting for room
+    blocked: float
+
+    def __init__(self, maxsize: int=10000, policy: t_RecvPolicy="block", spillPath: str | None=None):
+        if policy == "spill" and not spillPath:
+            raise ValueError("The \"spill\" policy needs a spillPath.")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.spillPath = spillPath
+
+        self.shed = {}
+        self.spilled = 0
+        self.blocked = 0
+
+        # Low priority payloads are kept apart so that the oldest one can be
+        #  shed without searching, and merged back in order on the way out.
+        self._high: deque[tuple[int, api.Payload]] = deque()
+        self._low: deque[tuple[int, api.Payload]] = deque()
+        self._order = itertools.count()
+        self._notEmpty = asyncio.Event()
+        self._notFull = asyncio.Event()
+        self._notFull.set()
+
+        self._spill: BinaryIO | None = None
+        self._spillRead = 0
+        self._spillCount = 0
+
+    def qsize(self):
+        """ Gets the number of payloads waiting, including spilled ones. """
+
+        return len(self._high) + len(self._low) + self._spillCount
+
+    def full(self):
+        """ Gets whether there's no more room in memory. """
+
+        return bool(self.maxsize) and len(self._high) + len(self._low) >= self.maxsize
+
+    def _push(self, payload: api.Payload):
+        item = (next(self._order), payload)
+        if payload.t in self.lowPriority:
+            self._low.append(item)
+        else:
+            self._high.append(item)
+        self._notEmpty.set()
+
+    def _pop(self):
+        if self._high and (not self._low or self._high[0][0] < self._low[0][0]):
+            return self._high.popleft()[1]
+        return self._low.popleft()[1]
+
+    def _count(self, payload: api.Payload):
+        name = payload.t.value if isinstance(payload.t, enums.tcode) else str(payload.t)
+        self.shed[name] = self.shed.get(name, 0) + 1
+
+    def _spillOut(self, payload: api.Payload):
+        if not self._spill:
+            self._spill = open(self.spillPath, "w+b") # type: ignore
+        self._spill.seek(0, 2)
+        self._spill.write(codec.dumps({
+            "op": payload.op, "t": payload.t, "s": payload.s, "d": payload.d, "shard": payload.shard
+        }) + b"\n")
+        self._spillCount += 1
+        self.spilled += 1
+        self._notEmpty.set()
+
+    def _spillIn(self):
+        assert self._spill
+        self._spill.seek(self._spillRead)
+        line = self._spill.readline()
+        self._spillRead = self._spill.tell()
+        self._spillCount -= 1
+        if not self._spillCount:
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spillRead = 0
+
+        raw = codec.loads(line)
+        payload = api.Payload.lazy(raw)
+        payload._shard = raw["shard"]
+        return payload
+
+    async def put(self, payload: api.Payload):
+        """ Adds a payload, applying the `policy` if there's no room. """
+
+        # Once anything is spilled, everything after it is too, to keep order.
+        if self._spillCount:
+            return self._spillOut(payload)
+
+        while self.full():
+            if self.policy == "shed":
+                if payload.t in self.lowPriority:
+                    return self._count(payload)
+                if self._low:
+                    self._count(self._low.popleft()[1])
+                    break
+            elif self.policy == "spill":
+                return self._spillOut(payload)
+
+            self._notFull.clear()
+            start = time.monotonic()
+            await self._notFull.wait()
+            self.blocked += time.monotonic() - start
+
+        self._push(payload)
+
+    async def get(self):
+        """ Waits for the next payload, then takes it out of the queue. """
+
+        while not (self._high or self._low):
+            if self._spillCount:
+                return self._spillIn()
+            self._notEmpty.clear()
+            await self._notEmpty.wait()
+
+        payload = self._pop()
+        # Keep the oldest spilled payload in memory, behind everything else.
+        if self._spillCount:
+            self._push(self._spillIn())
+        self._notFull.set()
+        return payload
+
+    def close(self):
+        """ Closes and removes the spill file, if one was made. """
+
+        if self._spill:
+            self._spill.close()
+            os.remove(self._spill.name)
+            self._spill = None
+            self._spillCount = 0
@@ -0,0 +1,315 @@
+""" Keeps requests to Discord's REST API within the per-route rate limits it
+    reports in the `X-RateLimit-*` headers, so that requests wait locally
+    instead of running into 429s.
+
+    https://discord.com/developers/docs/topics/rate-limits """
+
+import asyncio
+import math
+import time
+from typing import Any, Callable, ClassVar, Mapping
+
+from dubious.discord import codec
+
+# Path segments whose following ID is a "major parameter": routes with
+#  different values for it are limited separately.
+MAJOR = ("channels", "guilds", "webhooks")
+
+def routeOf(method: str, path: str):
+    """ Gets the route a request belongs to and its major parameter, from the
+        method and the part of the url after the API version. IDs and tokens
+        other than the major parameter are left out of the route. """
+
+    segments = path.strip("/").split("/")
+    major = ""
+    route: list[str] = []
+    for i, segment in enumerate(segments):
+        if i == 1 and segments[0] in MAJOR:
+            major = segment
+            route.append("{major}")
+        elif i == 2 and segments[0] in ("webhooks", "interactions"):
+            # Webhook and interaction tokens
+            if segments[0] == "webhooks": major += f"/{segment}"
+            route.append("{token}")
+        elif segment.isdigit():
+            route.append("{id}")
+        else:
+            route.append(segment)
+    return f"{method} /{'/'.join(route)}", major
+
+class RateLimited:
+    """ A 429 response, as told apart from the headers and body Discord (or
+        Cloudflare, in front of it) sent with it. """
+
+    # Seconds to wait before trying again
+    retryAfter: float
+    # Whether the limit was the global one, which holds up every route
+    isGlobal: bool
+    # "user", "global" or "shared", if Discord said
+    scope: str | None
+    # Whether the 429 came from Cloudflare rather than Discord's API, which
+    #  means the IP is banned for a while for making too many bad requests.
+    isBan: bool
+    method: str
+    path: str
+
+    def __init__(self, method: str, path: str, headers: Mapping[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.scope = headers.get("X-RateLimit-Scope")
+
+        try:
+            j = codec.loads(body)
+        except Exception:
+            j = None
+        if isinstance(j, dict) and "retry_after" in j:
+            self.isBan = False
+            self.retryAfter = float(j["retry_after"])
+            self.isGlobal = bool(j.get("global")) or "X-RateLimit-Global" in headers
+        else:
+            # Cloudflare's 429s are HTML, and only say how long in the header.
+            self.isBan = True
+            self.retryAfter = float(headers.get("Retry-After", 60))
+            self.isGlobal = True
+
+    def __repr__(self):
+        kind = "ban" if self.isBan else "global" if self.isGlobal else self.scope or "route"
+        return f"<RateLimited {kind} {self.method} {self.path} for {self.retryAfter:.2f}s>"
+
+class GlobalLimiter:
+    """ Keeps all requests from the process under Discord's global limit of
+        `perSecond` requests per second, and holds them all back when a global
+        429 (or a Cloudflare ban) says to.
+
+        One `GlobalLimiter` is shared by every `Http` in the process
+        (`.shared`). Set `.whenLimited` on it to hear about every 429 any of
+        them gets - e.g. to alert on bans. """
+
+    shared: ClassVar["GlobalLimiter"]
+
+    perSecond: int
+    whenLimited: Callable[[RateLimited], Any] | None
+
+    # 429s seen, by kind
+    limited: int
+    globalLimited: int
+    bans: int
+
+    def __init__(self, perSecond: int=50):
+        self.perSecond = perSecond
+        self.whenLimited = None
+
+        self.limited = 0
+        self.globalLimited = 0
+        self.bans = 0
+
+        # Nothing here is bound to an event loop, so that the shared instance
+        #  works from whichever loop is running.
+        self._windowStart = -math.inf
+        self._sent = 0
+        self._pausedUntil = -math.inf
+
+    @property
+    def paused(self):
+        return max(0, self._pausedUntil - time.monotonic())
+
+    async def acquire(self):
+        """ Waits until a request can be sent without going over the global
+            limit. Returns how long the wait was. """
+
+        start = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if self._pausedUntil > now:
+                await asyncio.sleep(self._pausedUntil - now)
+                continue
+            if now >= self._windowStart + 1:
+                self._windowStart = now
+                self._sent = 0
+            if self._sent < self.perSecond:
+                self._sent += 1
+                break
+            await asyncio.sleep(self._windowStart + 1 - now)
+        return time.monotonic() - start
+
+    def pause(self, seconds: float):
+        """ Holds back every request for `seconds`. """
+
+        self._pausedUntil = max(self._pausedUntil, time.monotonic() + seconds)
+
+    def record(self, limited: RateLimited):
+        """ Counts a 429, pauses everything if it was global, and passes it on
+            to `.whenLimited`. """
+
+        self.limited += 1
+        if limited.isBan:
+            self.bans += 1
+        if limited.isGlobal:
+            self.globalLimited += 1
+            self.pause(limited.retryAfter)
+        if self.whenLimited:
+            self.whenLimited(limited)
+
+GlobalLimiter.shared = GlobalLimiter()
+
+class Bucket:
+    """ One rate limit that Discord reports. Callers wait in `acquire`, in the
+        order they came in, until there's a request left in the window. """
+
+    # Unknown until the first response for the bucket comes back. Until then,
+    #  only one request is let through at a time.
+    limit: int | None
+    remaining: int
+    # When the current window ends, by `time.monotonic`. Once it has, it's
+    #  unknown (`math.inf`) until a response in the new window comes back.
+    resetAt: float
+    # Whether Discord said nothing about limits for this bucket
+    unlimited: bool
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = 1
+        self.resetAt = 0
+        self.unlimited = False
+
+        # When the last window that was refilled ended, so that responses
+        #  from it that come back late aren't mistaken for the new one.
+        self._lastReset = -math.inf
+        self._lock = asyncio.Lock()
+        self._updated = asyncio.Event()
+
+    async def acquire(self):
+        """ Waits until a request can be sent, then counts it against the
+            bucket. Returns how long the wait was. """
+
+        start = time.monotonic()
+        async with self._lock:
+            while not self.unlimited:
+                now = time.monotonic()
+                if self.limit is not None and self.resetAt <= now:
+                    self.remaining = self.limit
+                    self._lastReset = self.resetAt
+                    self.resetAt = math.inf
+                if self.remaining > 0:
+                    self.remaining -= 1
+                    break
+                if self.limit is None or self.resetAt == math.inf:
+                    # Requests are still out; wait to hear back.
+                    self._updated.clear()
+                    await self._updated.wait()
+                else:
+                    await asyncio.sleep(self.resetAt - now)
+        return time.monotonic() - start
+
+    def update(self, headers: Mapping[str, str]):
+        """ Takes in what Discord reported about the bucket in a response. """
+
+        if not "X-RateLimit-Limit" in headers:
+            self.unlimited = True
+        else:
+            self.unlimited = False
+            remaining = int(headers["X-RateLimit-Remaining"])
+            resetAt = time.monotonic() + float(headers["X-RateLimit-Reset-After"])
+            if self.limit is None:
+                self.remaining = remaining
+                self.resetAt = resetAt
+            elif resetAt > self._lastReset + 0.5:
+                # Other requests in the window may have been counted here
+                #  but not yet by Discord, so trust whichever count is lower.
+                self.remaining = min(self.remaining, remaining)
+                self.resetAt = resetAt
+            self.limit = int(headers["X-RateLimit-Limit"])
+        self._updated.set()
+
+    def hold(self, seconds: float):
+        """ Holds back requests for `seconds`, for a 429 that didn't come with
+            the bucket's headers. """
+
+        self.remaining = 0
+        resetAt = time.monotonic() + seconds
+        if self.resetAt == math.inf or self.resetAt < resetAt:
+            self.resetAt = resetAt
+        if self.limit is None:
+            self.limit = 1
+        self._updated.set()
+
+    def release(self):
+        """ Lets the next request through after one that got no response, so
+            that waiters on an unknown bucket aren't left hanging. """
+
+        if self.limit is None:
+            self.remaining = 1
+        elif self.resetAt == math.inf:
+            self.resetAt = self._lastReset
+        self._updated.set()
+
+class RateLimiter:
+    """ Maps each route to the bucket Discord puts it in, and holds requests
+        back until their bucket has room.
+
+        Routes are told apart by method and path (without IDs), and buckets by
+        the hash Discord gives in `X-RateLimit-Bucket` along with the route's
+        major parameter. Until a route's bucket is known, the route is its own
+        bucket.
+
+        Everything but interaction responses also goes through the process's
+        `GlobalLimiter`. """
+
+    # Route -> bucket hash, as discovered
+    routes: dict[str, str]
+    buckets: dict[tuple[str, str], Bucket]
+    globalLimiter: GlobalLimiter
+    # Seconds spent waiting for room, across all requests
+    waited: float
+
+    def __init__(self, globalLimiter: GlobalLimiter | None=None):
+        self.routes = {}
+        self.buckets = {}
+        self.globalLimiter = globalLimiter if globalLimiter else GlobalLimiter.shared
+        self.waited = 0
+
+    def bucketFor(self, route: str, major: str):
+        key = (self.routes.get(route, route), major)
+        if not key in self.buckets:
+            self.buckets[key] = Bucket()
+        return self.buckets[key]
+
+    async def acquire(self, method: str, path: str):
+        """ Waits until a request can be sent to the route, and gets its
+            bucket. """
+
+        route, major = routeOf(method, path)
+        bucket = self.bucketFor(route, major)
+        self.waited += await bucket.acquire()
+        if not route.startswith("POST /interactions/"):
+            # Interaction responses don't count towards the global limit.
+            try:
+                self.waited += await self.globalLimiter.acquire()
+            except BaseException:
+                # Nothing was sent, so the bucket mustn't wait on a response.
+                bucket.release()
+                raise
+        return bucket
+
+    def update(self, method: str, path: str, bucket: Bucket, headers: Mapping[str, str]):
+        """ Takes in the rate limit headers of a response, learning which
+            bucket the route is in if it wasn't known yet. """
+
+        bucket.update(headers)
+        bucketHash = headers.get("X-RateLimit-Bucket")
+        if not bucketHash: return
+
+        route, major = routeOf(method, path)
+        if self.routes.get(route) != bucketHash:
+            self.routes[route] = bucketHash
+            # Carry what's been learned (and who's waiting) over to the
+            #  bucket's proper key, unless another route got there first.
+            self.buckets.setdefault((bucketHash, major), bucket)
+
+    def limited(self, bucket: Bucket, limited: RateLimited):
+        """ Takes in a 429, holding back the bucket (or everything) until it's
+            safe to try again. """
+
+        if not limited.isGlobal:
+            bucket.hold(limited.retryAfter)
+        self.globalLimiter.record(limited)
@@ -0,0 +1,63 @@
+""" A compact, append-only file format for recording gateway traffic, so that
+    it can be replayed later with a `Replayer`.
+
+    The file starts with `MAGIC`, then holds one record per frame: a header
+    packed as `FRAME` (the time it was recieved, the shard that recieved it,
+    the encoding, and the length of the data), followed by the data itself.
+    The data is the frame as Discord sent it, after zlib-stream inflating. """
+
+import struct
+import time
+from typing import BinaryIO, Iterator, Literal
+
+MAGIC = b"DUBREC1\n"
+# time.time(), shard ID, encoding, data length
+FRAME = struct.Struct("<dHBI")
+
+ENCODINGS: tuple[Literal["json", "etf"], ...] = ("json", "etf")
+
+class RecordingError(Exception):
+    """ The file isn't a recording, or is cut off partway through a frame. """
+
+class Recorder:
+    """ Appends frames to a recording. One `Recorder` can be shared by several
+        shards, since each frame is tagged with its shard. """
+
+    path: str
+    frames: int
+
+    def __init__(self, path: str):
+        self.path = path
+        self.frames = 0
+        self._f: BinaryIO | None = open(path, "ab")
+        if not self._f.tell():
+            self._f.write(MAGIC)
+
+    def write(self, data: str | bytes, shard: int=0, encoding: Literal["json", "etf"]="json"):
+        """ Appends a frame recieved right now. """
+
+        if not self._f: return
+        if isinstance(data, str):
+            data = data.encode()
+        self._f.write(FRAME.pack(time.time(), shard, ENCODINGS.index(encoding), len(data)) + data)
+        self.frames += 1
+
+    def close(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+
+def read(path: str) -> Iterator[tuple[float, int, Literal["json", "etf"], bytes]]:
+    """ Yields each frame in a recording as `(time, shard, encoding, data)`. """
+
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise RecordingError(f"`{path}` isn't a recording.")
+        while header := f.read(FRAME.size):
+            if len(header) < FRAME.size:
+                raise RecordingError(f"`{path}` ends partway through a frame header.")
+            recievedAt, shard, encoding, length = FRAME.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                raise RecordingError(f"`{path}` ends partway through a frame.")
+            yield recievedAt, shard, ENCODINGS[encoding], data
@@ -0,0 +1,136 @@
+import asyncio
+import time
+from typing import Callable, Iterator
+
+from dubious.discord import api, codec, etf, recording
+from dubious.discord.core import Core
+from dubious.discord.queues import RecvQueue
+
+class Replayer(Core):
+    """ Plays back a recording made by a `Recorder` in place of a connection to
+        Discord. Quacks like a `Discore` to a `Chip`, so that the recorded
+        payloads go through `Chip._loop_dispatch` like live ones.
+
+        With a `speed` of 1, payloads come out with the same gaps between them
+        as when they were recorded (2 is twice as fast, and so on). With no
+        `speed`, they come out as fast as they can be handled.
+
+        Nothing gets sent anywhere - `.send` drops its payload. """
+
+    path: str
+    speed: float | None
+    # Gets called once every recorded payload has been handled
+    whenDone: Callable[[], None] | None
+    # Pory uses this for its Http, which can't reach Discord during a replay
+    token: str
+
+    running: asyncio.Event
+    _rq: RecvQueue
+
+    replayed: int
+    # Seconds from the first payload being put in to the last one being handled
+    elapsed: float | None
+
+    def __init__(self,
+        path: str,
+        speed: float | None=1,
+        rq: RecvQueue | None=None,
+        token: str=""
+    ):
+        self.path = path
+        self.speed = speed
+        self.whenDone = None
+        self.token = token
+
+        self.running = asyncio.Event()
+        self._rq = rq if rq else RecvQueue()
+
+        self.replayed = 0
+        self.elapsed = None
+        # Kept between restarts so that the replay carries on where it was.
+        self._frames: Iterator[tuple[float, int, str, bytes]] = recording.read(path)
+        self._startedAt: float | None = None
+        self._done = False
+
+    def getcoros(self):
+        return (
+            self._task_replay(),
+        )
+
+    def set(self):
+        self.running.set()
+
+    def isRunning(self):
+        return self.running.is_set()
+
+    def clear(self):
+        self.running.clear()
+
+    async def close(self):
+        pass
+
+    @property
+    def latency(self): return None
+    @property
+    def latencyWindow(self): return []
+
+    @property
+    def recvQueue(self):
+        return self._rq
+
+    @property
+    def status(self):
+        return "stopped" if self._done else "replaying"
+
+    def _decode(self, encoding: str, data: bytes):
+        if encoding == "etf":
+            return api.Payload.lazy(etf.loads(data))
+        return api.Payload.lazy(codec.loads(data))
+
+    async def _task_replay(self):
+        """ Loop for putting each recorded payload into the recv queue, at the
+            time it's due. """
+
+        await self.running.wait()
+        if self._startedAt is None:
+            self._startedAt = time.perf_counter()
+
+        # Timing restarts from here, if the loops were restarted.
+        base: tuple[float, float] | None = None
+        for recievedAt, shard, encoding, data in self._frames:
+            if self.speed:
+                if not base: base = (recievedAt, time.perf_counter())
+                due = base[1] + (recievedAt - base[0]) / self.speed
+                wait = due - time.perf_counter()
+                if wait > 0: await asyncio.sleep(wait)
+
+            payload = self._decode(encoding, data)
+            payload._shard = shard
+            await self._rq.put(payload)
+            self.replayed += 1
+        # No awaits between the last put and here, so the last payload can't
+        #  have been taken out of the queue yet.
+        self._done = True
+        if not self._rq.qsize():
+            self._finish()
+
+    def _finish(self):
+        assert self._startedAt is not None
+        self.elapsed = time.perf_counter() - self._startedAt
+        rate = self.replayed / self.elapsed if self.elapsed else 0
+        self.debug(f"replayed {self.replayed} payloads in {self.elapsed:.2f}s ({rate:.0f}/s)")
+        if self.whenDone: self.whenDone()
+
+    async def recv(self):
+        """ Gets the next recorded `Payload`. Calls `.whenDone` instead once
+            every payload has been gotten, which means the one before this call
+            has been handled. """
+
+        if self._done and not self._rq.qsize():
+            self._finish()
+            # Left for `.whenDone` to cancel.
+            await asyncio.Future()
+        return await self._rq.get()
+
+    async def send(self, payload: api.Payload):
+        """ Drops the payload, since there's no connection to send it on. """
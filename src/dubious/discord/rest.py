@@ -1,13 +1,16 @@
 
 import asyncio
+import sys
+import time
+from collections import OrderedDict
 from enum import Enum
-from typing import (Any, ClassVar, Dict, Generic, List, Literal, TypeVar,
-                    overload)
+from typing import (Any, Callable, ClassVar, Coroutine, Dict, Generic, List,
+                    Literal, TypeVar, overload)
 
 import aiohttp
 from aiohttp import hdrs
-from dubious.discord import api, make
-from pydantic import BaseModel
+from dubious.discord import api, codec, make
+from dubious.discord.ratelimit import RateLimited, RateLimiter
 
 from dubious.discord.enums import IxnOriginal
 
@@ -23,33 +26,142 @@ def removeNonDicts(l: List) -> List[Dict]:
     return l
 
 t_IDable = TypeVar("t_IDable", bound=api.IDable)
-class Cache(Generic[t_IDable], BaseModel):
+
+def _key(oID: api.Snowflake | int | str):
+    # Snowflakes hash and compare in Python, so the cache is keyed by their
+    #  ints instead to keep its dict operations in C.
+    return oID.id if isinstance(oID, api.Snowflake) else int(oID)
+
+def _sizeOf(item: api.IDable):
+    """ A rough guess at how many bytes an object takes up: itself and its
+        fields, but not what's nested in them. """
+
+    return sys.getsizeof(item) + sum(sys.getsizeof(v) for v in item.__dict__.values())
+
+class Cache(Generic[t_IDable]):
+    """ Keeps up to `maxSize` objects by ID, dropping the least recently used
+        one to make room. Getting and putting are O(1).
+
+        Objects are also dropped once they're older than `ttl` seconds, if
+        given, and the least recently used ones are dropped while the objects'
+        sizes (as guessed by `sizeOf`) add up to more than `maxBytes`, if
+        given. """
+
     cast: type[t_IDable]
-    maxSize: int = 1000
-    items: Dict[api.Snowflake, t_IDable] = {}
-    order: List[api.Snowflake] = []
+    maxSize: int
+    # Seconds an item is kept for, or until it's evicted if None
+    ttl: float | None
+    maxBytes: int | None
+    sizeOf: Callable[[t_IDable], int]
+
+    # Each item, when it was put in (by `time.monotonic`) and its size, from
+    #  least to most recently used
+    items: "OrderedDict[int, tuple[t_IDable, float, int]]"
+    size: int
+    # Goes up whenever an item is forgotten, so that lookups that were in
+    #  flight at the time know not to put back what they got.
+    generation: int
+
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+
+    def __init__(self,
+        cast: type[t_IDable],
+        maxSize: int=1000,
+        ttl: float | None=None,
+        maxBytes: int | None=None,
+        sizeOf: Callable[[t_IDable], int]=_sizeOf
+    ):
+        self.cast = cast
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.maxBytes = maxBytes
+        self.sizeOf = sizeOf
+
+        self.items = OrderedDict()
+        self.size = 0
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, oID: api.Snowflake):
+        return _key(oID) in self.items
+
+    def _drop(self, key: int):
+        _, _, size = self.items.pop(key)
+        self.size -= size
 
     def _add(self, item: t_IDable):
-        if item.id in self.items:
-            return self.items[item.id]
-        if len(self.items) + 1 > self.maxSize:
-            self.items.pop(self.order[0])
-            self.order.pop(0)
-        self.items[item.id] = item
-        self.order.append(item.id)
+        key = _key(item.id)
+        old = self.items.pop(key, None)
+        if old: self.size -= old[2]
+        size = self.sizeOf(item) if self.maxBytes is not None else 0
+        self.items[key] = (item, time.monotonic(), size)
+        self.size += size
+        while len(self.items) > self.maxSize or (self.maxBytes is not None and self.size > self.maxBytes and len(self.items) > 1):
+            _, (_, _, size) = self.items.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
         return item
-    
+
+    def put(self, item: t_IDable):
+        """ Adds an item, replacing the one with the same ID if there is one. """
+
+        return self._add(item)
+
     def add(self, j: dict | list):
+        """ Parses and adds an item, or each item in a list. """
+
         if isinstance(j, list):
-            items = [self.cast.parse_obj(item) for item in removeNonDicts(j)]
-            for item in items:
-                self._add(item)
-        item = self.cast.parse_obj(j)
-        item = self._add(item)
-        return item
-    
+            return [self._add(self.cast.parse_obj(item)) for item in removeNonDicts(j)]
+        return self._add(self.cast.parse_obj(j))
+
+    def forget(self, oID: api.Snowflake):
+        self.generation += 1
+        key = _key(oID)
+        if key in self.items:
+            self._drop(key)
+
     def get(self, oID: api.Snowflake):
-        return self.items.get(oID)
+        key = _key(oID)
+        entry = self.items.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        item, addedAt, _ = entry
+        if self.ttl is not None and time.monotonic() - addedAt > self.ttl:
+            self._drop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.items.move_to_end(key)
+        self.hits += 1
+        return item
+
+    def clear(self):
+        self.items.clear()
+        self.size = 0
+        self.generation += 1
+
+    def stats(self):
+        """ Gets the cache's size and counters, e.g. for logging. """
+
+        return {
+            "items": len(self.items),
+            "bytes": self.size if self.maxBytes is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
 
 class HTTPError(Exception):
     """ Something went wrong with an HTTP request."""
@@ -75,8 +187,22 @@ class ResponseError(Exception):
     def __init__(self, method: str, url: str, expected: type):
         super().__init__(f"{method} {url}: Expected {expected}")
 
+class RateLimitError(Exception):
+    """ A request kept getting rate limited, or the IP got banned. """
+    def __init__(self, method: str, url: str, limited: RateLimited):
+        self.limited = limited
+        super().__init__(f"{method} {url}: {limited}")
+
+class StatusError(Exception):
+    """ A request failed without the JSON error body Discord normally sends,
+        like a 502 page from Cloudflare. Keeps the status and the body's text. """
+    def __init__(self, method: str, url: str, status: int, body: str):
+        self.status = status
+        self.body = body
+        super().__init__(f"{method} {url}: {status}\n{body[:500]}")
+
 class BuildURL:
-    def __init__(self, baseUrl: str, aID: api.Snowflake) -> None:
+    def __init__(self, baseUrl: str, aID: api.Snowflake | None) -> None:
         self.baseUrl = baseUrl
         self.id = aID
 
@@ -109,6 +235,9 @@ class BuildURL:
         token = f"/{webhookToken}" if webhookID and webhookToken else ""
         return self.baseUrl + webhooks + wid + token
 
+    def gatewayBot(self):
+        return self.baseUrl + "/gateway/bot"
+
     def webhookMessages(self, webhookID: api.Snowflake, webhookToken: str, messageID: api.Snowflake | None | Literal["@original"]):
         webhooks = f"/webhooks/{webhookID}/{webhookToken}"
         messages = f"/messages/{messageID}" if messageID else ""
@@ -126,19 +255,43 @@ class Http:
     token: str
     session: aiohttp.ClientSession
 
-    caches: Dict[type[api.IDable], Cache] = {}
+    caches: Dict[type[api.IDable], Cache]
+    # Seconds that guilds, channels and messages from `getGuild`, `getChannel`
+    #  and `getMessage` are kept for before being looked up again. They're
+    #  also forgotten as soon as the gateway says they've changed.
+    ttls: ClassVar[Dict[type[api.IDable], float | None]] = {
+        api.Guild: 300,
+        api.Channel: 300,
+        api.Message: 60,
+    }
+    limiter: RateLimiter
+    # GETs that shared a request already in flight instead of making their own
+    coalesced: int
+
+    # How many times a request is tried again after a 429 (or a 5xx) before
+    #  giving up
+    maxRetries: ClassVar = 5
+    # Seconds before the first retry of a request that failed on Discord's
+    #  side, doubling with each try after
+    retryDelay: ClassVar = 0.5
 
     version: ClassVar = "v9"
     baseUrl: ClassVar = f"https://discord.com/api/{version}"
     url: BuildURL
 
-    def __init__(self, appID: api.Snowflake, appToken: str):
+    def __init__(self, appID: api.Snowflake | None, appToken: str, ttls: Dict[type[api.IDable], float | None] | None=None):
         self.id = appID
         self.token = appToken
         self.session = aiohttp.ClientSession()
+        self.limiter = RateLimiter()
+        self.coalesced = 0
+        self._inFlight: Dict[tuple[Any, ...], asyncio.Task[Any]] = {}
 
         self.url = BuildURL(self.baseUrl, self.id)
 
+        if ttls: self.ttls = self.ttls | ttls
+
+        self.caches = {}
         for typ in [
             api.ApplicationCommand,
             api.Guild,
@@ -150,27 +303,53 @@ class Http:
         self.auth = {
             "Authorization": f"Bot {self.token}"
         }
+        self.authJSON = self.auth | {
+            hdrs.CONTENT_TYPE: "application/json"
+        }
 
     def _addCache(self, typ: type[api.IDable]):
-        self.caches[typ] = Cache(cast=typ)
+        self.caches[typ] = Cache(cast=typ, ttl=self.ttls.get(typ))
+
+    def cacheStats(self):
+        """ Gets each cache's size and counters, by type name. """
+
+        return {typ.__name__: cache.stats() for typ, cache in self.caches.items()}
+
+    def forget(self, typ: type[api.IDable], oID: api.Snowflake):
+        """ Drops an object from its cache, so that the next lookup gets it
+            from Discord. """
+
+        if typ in self.caches:
+            self.caches[typ].forget(oID)
+
+    async def _lookup(self, typ: type[t_IDable], oID: api.Snowflake, fetch: Callable[[], Coroutine[Any, Any, t_IDable]]) -> t_IDable:
+        """ Gets an object from its cache, or from Discord (with `fetch`) if
+            it isn't there. """
+
+        cache = self.caches[typ]
+        item = cache.get(oID)
+        if item is None:
+            generation = cache.generation
+            item = await fetch()
+            if cache.generation == generation:
+                cache.put(item)
+        return item
 
     async def close(self):
         await self.session.close()
 
     async def handleRes(self, res: aiohttp.ClientResponse):
+        body = await res.read()
         if not res.status in range(200, 300):
-            error = api.Error(**await res.json())
-            if error.retry_after is not None:
-                await asyncio.sleep(error.retry_after)
-                return False # rate limited
-
-            return error
+            try:
+                return api.Error(**codec.loads(body))
+            except (ValueError, TypeError):
+                raise StatusError(res.method, str(res.url), res.status, body.decode(errors="replace"))
 
-        if not await res.text():
+        if not body:
             return None
 
-        got = await res.json()
-        return got
+        return codec.loads(body)
 
     @overload
     async def request(self, method: str, typ: type[t_IDable], expects: Literal[Expects.none], url: str, payload: make.Make | None=None, **params: Any) -> None: ...
@@ -180,29 +359,88 @@ class Http:
     async def request(self, method: str, typ: type[t_IDable], expects: Literal[Expects.multiple], url: str, payload: make.Make | None=None, **params: Any) -> List[t_IDable]: ...
     
     async def request(self, method: str, typ: type[t_IDable], expects: t_Expects, url: str, payload: make.Make | None=None, **params: Any) -> None | t_IDable | List[t_IDable]:
-        headers: Dict[str, Dict[str, Any] | str] = {"headers": self.auth}
-        if payload: headers["json"] = payload.dict()
+        """ Makes a request and parses what comes back. A GET that's the same
+            as one already in flight waits for that one and gets the same
+            result, rather than making another. """
+
+        if method != "GET":
+            return await self._request(method, typ, expects, url, payload, **params)
+
+        key = (url, typ, expects, tuple(sorted(params.items())))
+        task = self._inFlight.get(key)
+        if task:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self._request(method, typ, expects, url, payload, **params))
+            self._inFlight[key] = task
+            task.add_done_callback(lambda t: self._settle(key, t))
+        # Shielded so that one caller giving up doesn't cancel it for the rest.
+        return await asyncio.shield(task)
+
+    def _settle(self, key: tuple[Any, ...], task: asyncio.Task[Any]):
+        self._inFlight.pop(key, None)
+        # Keeps asyncio from complaining if every caller had given up.
+        if not task.cancelled(): task.exception()
+
+    async def _request(self, method: str, typ: type[t_IDable], expects: t_Expects, url: str, payload: make.Make | None=None, **params: Any) -> None | t_IDable | List[t_IDable]:
+        headers: Dict[str, Dict[str, Any] | str | bytes] = {"headers": self.auth}
+        if payload:
+            headers["headers"] = self.authJSON
+            headers["data"] = codec.dumps(payload.dict())
         if params: headers["params"] = params
 
-        async with self.session.request(method, url, **headers) as res:
-            ret = await self.handleRes(res)
+        path = url[len(self.baseUrl):]
+        for attempt in range(self.maxRetries + 1):
+            bucket = await self.limiter.acquire(method, path)
+            limited = None
+            failed = None
+            try:
+                async with self.session.request(method, url, **headers) as res:
+                    if res.status >= 500 and not "X-RateLimit-Limit" in res.headers:
+                        # Whatever answered wasn't Discord's API, so this says
+                        #  nothing about the bucket.
+                        bucket.release()
+                    else:
+                        self.limiter.update(method, path, bucket, res.headers)
+                    if res.status == 429:
+                        limited = RateLimited(method, path, res.headers, await res.read())
+                    elif res.status in (502, 503, 504) or (res.status >= 500 and method == "GET"):
+                        # Other methods might have gone through before a 500,
+                        #  so only GETs are tried again.
+                        failed = StatusError(method, url, res.status, await res.text(errors="replace"))
+                    else:
+                        ret = await self.handleRes(res)
+            except BaseException:
+                bucket.release()
+                raise
+            if limited:
+                # The limiter holds back the next try for as long as it needs.
+                self.limiter.limited(bucket, limited)
+                if limited.isBan: raise RateLimitError(method, url, limited)
+            elif failed:
+                if attempt < self.maxRetries:
+                    await asyncio.sleep(self.retryDelay * 2 ** attempt)
+            else:
+                break
+        else:
+            if failed: raise failed
+            assert limited
+            raise RateLimitError(method, url, limited)
 
-            if ret == False: # rate limited (waiting happens in the handleRes)
-                return await self.request(method, typ, expects, url, payload, **params)
-            if isinstance(ret, api.Error):
-                raise HTTPError(url, ret, payload)
+        if isinstance(ret, api.Error):
+            raise HTTPError(url, ret, payload)
 
-            if expects == Expects.none:
-                if ret is not None: raise ResponseError(method, url, type(None))
-                return ret
-            if expects == Expects.single:
-                if not isinstance(ret, dict): raise ResponseError(method, url, typ)
-                return typ.parse_obj(ret)
-            if expects == Expects.multiple:
-                if not isinstance(ret, list): raise ResponseError(method, url, list[typ])
-                return [typ.parse_obj(item) for item in ret]
+        if expects == Expects.none:
+            if ret is not None: raise ResponseError(method, url, type(None))
+            return ret
+        if expects == Expects.single:
+            if not isinstance(ret, dict): raise ResponseError(method, url, typ)
+            return typ.parse_obj(ret)
+        if expects == Expects.multiple:
+            if not isinstance(ret, list): raise ResponseError(method, url, list[typ])
+            return [typ.parse_obj(item) for item in ret]
 
-            raise ResponseError(method, url, Any)
+        raise ResponseError(method, url, Any)
 
     async def getGlobalCommands(self):
         return await self.request(
@@ -246,9 +484,9 @@ class Http:
             self.url.commands(guildID, commandID))
 
     async def getMessage(self, channelID: api.Snowflake, messageID: api.Snowflake):
-        return await self.request(
+        return await self._lookup(api.Message, messageID, lambda: self.request(
             hdrs.METH_GET, api.Message, Expects.single,
-            self.url.messages(channelID, messageID) )
+            self.url.messages(channelID, messageID) ))
     async def getMessages(self, channelID: api.Snowflake, limit: int=100):
         assert limit > 0 and limit <= 100
         return await self.request(
@@ -259,15 +497,18 @@ class Http:
             hdrs.METH_POST, api.Message, Expects.single,
             self.url.messages(channelID, None), message)
     async def patchMessage(self, channelID: api.Snowflake, messageID: api.Snowflake, message: make.RMessage):
+        self.forget(api.Message, messageID)
         return await self.request(
             hdrs.METH_PATCH, api.Message, Expects.single,
             self.url.messages(channelID, messageID), message)
     async def deleteMessage(self, channelID: api.Snowflake, messageID: api.Snowflake):
+        self.forget(api.Message, messageID)
         return await self.request(
             hdrs.METH_DELETE, api.Message, Expects.single,
             self.url.messages(channelID, messageID) )
     async def deleteMessages(self, channelID: api.Snowflake, messageIDs: List[api.Snowflake]):
         assert len(messageIDs) <= 100
+        for messageID in messageIDs: self.forget(api.Message, messageID)
         return await self.request(
             hdrs.METH_POST, api.Message, Expects.multiple,
             self.url.messages(channelID, "bulk-delete"), messages=messageIDs)
@@ -293,12 +534,17 @@ class Http:
             hdrs.METH_DELETE, api.Message, Expects.none,
             self.url.webhookMessages(self.id, token, messageID))
 
-    async def getGuild(self, id: api.Snowflake):
+    async def getGatewayBot(self):
         return await self.request(
+            hdrs.METH_GET, api.GatewayBot, Expects.single,
+            self.url.gatewayBot() )
+
+    async def getGuild(self, id: api.Snowflake):
+        return await self._lookup(api.Guild, id, lambda: self.request(
             hdrs.METH_GET, api.Guild, Expects.single,
-            self.url.guilds(id) )
+            self.url.guilds(id) ))
 
     async def getChannel(self, id: api.Snowflake):
-        return await self.request(
+        return await self._lookup(api.Channel, id, lambda: self.request(
             hdrs.METH_GET, api.Channel, Expects.single,
-            self.url.channels(id) )
+            self.url.channels(id) ))
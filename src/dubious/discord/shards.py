@@ -0,0 +1,215 @@
+import asyncio
+import time
+import traceback
+from typing import Any, Iterable
+
+from dubious.discord import api, rest
+from dubious.discord.core import Core, Discore, Restart
+from dubious.discord.identify import IdentifyScheduler
+from dubious.discord.queues import RecvQueue
+
+class ShardManager(Core):
+    """ Runs one `Discore` per shard, with every shard feeding the same recv
+        queue. Quacks like a `Discore` to a `Chip`, so that payloads from all
+        shards are handled by one `Chip._loop_dispatch`. Each `Payload` is
+        tagged with the `.shard` that recieved it.
+
+        If no shard count is given, the count Discord recommends is fetched
+        from `/gateway/bot` on start, along with how many shards can identify
+        at once (`maxConcurrency`). Shards identify through one
+        `IdentifyScheduler`, so that every bucket of shards starts up in
+        parallel. How long it took for all shards to be ready is kept in
+        `.readyAfter`.
+
+        Each shard restarts on its own when its connection fails or Discord
+        asks it to reconnect, without touching the other shards. """
+
+    token: str
+    intents: int
+    count: int | None
+    ids: list[int] | None
+    maxConcurrency: int | None
+    identifier: IdentifyScheduler
+    # Keyword arguments passed on to each `Discore`
+    options: dict[str, Any]
+
+    shards: dict[int, Discore]
+    running: asyncio.Event
+    _rq: RecvQueue
+
+    # Seconds from the first start until every shard was ready
+    readyAfter: float | None
+    _startedAt: float | None
+
+    def __init__(self,
+        token: str,
+        intents: int,
+        count: int | None=None,
+        ids: Iterable[int] | None=None,
+        rq: RecvQueue | None=None,
+        maxConcurrency: int | None=None,
+        identifier: IdentifyScheduler | None=None,
+        **options: Any
+    ):
+        self.token = token
+        self.intents = intents
+        self.count = count
+        self.ids = list(ids) if ids is not None else None
+        self.maxConcurrency = maxConcurrency
+        self.identifier = identifier if identifier else IdentifyScheduler.shared
+        self.options = options
+
+        self.readyAfter = None
+        self._startedAt = None
+
+        self.shards = {}
+        self.running = asyncio.Event()
+        self._rq = rq if rq else RecvQueue()
+
+    def getcoros(self):
+        return (
+            self._task_shards(),
+        )
+
+    def set(self):
+        self.running.set()
+        for shard in self.shards.values():
+            shard.set()
+
+    def isRunning(self):
+        return self.running.is_set()
+
+    def clear(self):
+        self.running.clear()
+        for shard in self.shards.values():
+            shard.clear()
+
+    async def close(self):
+        await asyncio.gather(*(shard.close() for shard in self.shards.values()))
+
+    @property
+    def recvQueue(self):
+        """ The `RecvQueue` shared by every shard. """
+
+        return self._rq
+
+    async def fetchGateway(self):
+        """ Gets the shard count and session start limits Discord gives for
+            the bot. """
+
+        http = rest.Http(None, self.token)
+        try:
+            return await http.getGatewayBot()
+        finally:
+            await http.close()
+
+    async def fetchCount(self):
+        """ Gets the number of shards Discord recommends for the bot. """
+
+        return (await self.fetchGateway()).shards
+
+    def _makeShard(self, shardID: int, count: int):
+        options = dict(self.options)
+        # Each shard resumes its own session.
+        if options.get("sessionPath"):
+            options["sessionPath"] = f"{options['sessionPath']}.{shardID}"
+        shard = Discore(self.token, self.intents,
+            shard=(shardID, count), rq=self._rq, identifier=self.identifier, **options
+        )
+        if self.isRunning(): shard.set()
+        return shard
+
+    async def _task_shards(self):
+        """ Creates the `Discore` for each shard this manager runs (once), then
+            runs all of their loops. """
+
+        if self._startedAt is None:
+            self._startedAt = time.monotonic()
+
+        if self.count is None or self.maxConcurrency is None:
+            gateway = await self.fetchGateway()
+            if self.count is None:
+                self.count = gateway.shards
+            if self.maxConcurrency is None:
+                self.maxConcurrency = gateway.session_start_limit.max_concurrency
+        self.identifier.maxConcurrency = self.maxConcurrency
+
+        for shardID in self.ids if self.ids is not None else range(self.count):
+            if not shardID in self.shards:
+                self.shards[shardID] = self._makeShard(shardID, self.count)
+
+        await asyncio.gather(self._task_ready(), *(
+            self._runShard(shardID, shard) for shardID, shard in self.shards.items()
+        ))
+
+    async def _runShard(self, shardID: int, shard: Discore):
+        """ Runs a shard's loops, closing and restarting just that shard
+            whenever one of them fails, for as long as the manager runs. """
+
+        while self.isRunning():
+            tasks = [asyncio.ensure_future(coro) for coro in shard.getcoros()]
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    if not task.cancelled() and task.exception():
+                        raise task.exception() # type: ignore
+            except Restart as e:
+                self.debug(f"shard {shardID} restarting: {e}")
+            except Exception as e:
+                self.debug(f"shard {shardID} failed:", *traceback.format_exception(e))
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            # The manager's own `.close` takes care of shards when it stops.
+            if self.isRunning():
+                await shard.close()
+
+    async def _task_ready(self):
+        """ Records how long it took for every shard to be ready the first
+            time around. """
+
+        if self.readyAfter is not None: return
+        await asyncio.gather(*(shard.ready.wait() for shard in self.shards.values()))
+        assert self._startedAt is not None
+        self.readyAfter = time.monotonic() - self._startedAt
+        self.debug(f"all {len(self.shards)} shards ready after {self.readyAfter:.2f}s")
+
+    def shardFor(self, guildID: api.Snowflake | int):
+        """ Gets the ID of the shard that recieves events for a guild. """
+
+        if self.count is None: raise RuntimeError("The shard count isn't known until the manager starts.")
+        return (int(guildID) >> 22) % self.count
+
+    def shardStatus(self):
+        """ Gets the `Discore.status` of each shard by shard ID. """
+
+        return {shardID: shard.status for shardID, shard in self.shards.items()}
+
+    def latencies(self):
+        """ Gets the last heartbeat latency of each shard by shard ID. """
+
+        return {shardID: shard.latency for shardID, shard in self.shards.items()}
+
+    @property
+    def latencyWindow(self):
+        """ Gets the recent heartbeat latencies of each shard by shard ID. """
+
+        return {shardID: shard.latencyWindow for shardID, shard in self.shards.items()}
+
+    @property
+    def latency(self):
+        """ The average heartbeat latency across all shards that have one. """
+
+        known = [latency for latency in self.latencies().values() if latency is not None]
+        return sum(known) / len(known) if known else None
+
+    async def recv(self):
+        """ Gets a `Payload` sent by Discord to any of the shards. """
+
+        return await self._rq.get()
+
+    async def send(self, payload: api.Payload, shardID: int=0):
+        """ Puts a `Payload` into the send queue of a shard. """
+
+        await self.shards[shardID].send(payload)